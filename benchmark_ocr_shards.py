@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Script to check page-shard parallel OCR against single-pass OCR.
+Runs every PDF in a folder through MinerU both ways, reports the timings and
+whether the markdown, content list and middle JSON are identical.
+"""
+
+import os
+import sys
+import time
+import argparse
+
+# Make the service modules importable the same way the app imports them
+SERVICES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pdf_processor', 'services')
+sys.path.insert(0, SERVICES_DIR)
+
+def compare_pdf(pdf_path, shard_pages):
+    """
+    Run one PDF through single-pass and sharded OCR
+
+    Args:
+        pdf_path (str): Path to the PDF file
+        shard_pages (int): Pages per shard for the sharded run
+
+    Returns:
+        dict: Timings in seconds and the list of outputs that differ
+    """
+    from ocr_service import _run_mineru
+
+    with open(pdf_path, 'rb') as f:
+        pdf_bytes = f.read()
+    document_id = os.path.splitext(os.path.basename(pdf_path))[0]
+
+    start = time.time()
+    single = _run_mineru(pdf_bytes, document_id, shard_pages=0)
+    single_time = time.time() - start
+
+    start = time.time()
+    sharded = _run_mineru(pdf_bytes, document_id, shard_pages=shard_pages)
+    sharded_time = time.time() - start
+
+    mismatches = [name for name in single if single[name] != sharded[name]]
+    return {
+        'single_time': single_time,
+        'sharded_time': sharded_time,
+        'mismatches': mismatches
+    }
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Compare page-shard parallel OCR with single-pass OCR')
+    parser.add_argument('corpus_dir', help='Directory containing benchmark PDFs')
+    parser.add_argument('--shard-pages', type=int, default=8, help='Pages per shard for the sharded run')
+
+    args = parser.parse_args()
+
+    # Check if the corpus directory exists
+    if not os.path.isdir(args.corpus_dir):
+        print(f"Error: Corpus directory '{args.corpus_dir}' not found")
+        return 1
+
+    pdf_files = sorted(f for f in os.listdir(args.corpus_dir) if f.lower().endswith('.pdf'))
+    failures = 0
+
+    for pdf_file in pdf_files:
+        result = compare_pdf(os.path.join(args.corpus_dir, pdf_file), args.shard_pages)
+        status = 'MATCH' if not result['mismatches'] else f"DIFF ({', '.join(result['mismatches'])})"
+        print(
+            f"{pdf_file}: single {result['single_time']:.1f}s, "
+            f"sharded {result['sharded_time']:.1f}s - {status}"
+        )
+        if result['mismatches']:
+            failures += 1
+
+    print(f"{len(pdf_files) - failures}/{len(pdf_files)} documents match")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
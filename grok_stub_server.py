@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Script to run a local stand-in for the Grok X chat completions API.
+Answers /v1/chat/completions like the real endpoint (plain and streamed), with
+configurable latency, token rate, injected 429/5xx errors and rate limits, so the
+summary stage can be load tested offline. Point the app at it with:
+
+    GROK_API_URL=http://localhost:8001/v1/chat/completions GROK_API_KEY=stub
+"""
+
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from collections import deque
+
+from flask import Flask, Response, jsonify, request
+
+app = Flask(__name__)
+
+# Settings from the command line, see main()
+settings = None
+
+# Sliding one-minute windows of request times and (time, tokens) pairs for the rate limits
+rate_lock = threading.Lock()
+request_times = deque()
+token_usage = deque()
+
+stats_lock = threading.Lock()
+stats = {
+    'requests': 0,
+    'completed': 0,
+    'rate_limited': 0,
+    'server_errors': 0,
+    'in_flight': 0,
+    'max_in_flight': 0,
+}
+
+WORD_PATTERN = re.compile(r"\S+")
+
+def sample_latency():
+    """
+    Draw a time to first token from the configured distribution
+
+    Returns:
+        float: Latency in seconds
+    """
+    mean = settings.latency_mean
+    spread = settings.latency_spread
+
+    if settings.latency_dist == 'fixed':
+        latency = mean
+    elif settings.latency_dist == 'uniform':
+        latency = random.uniform(mean - spread, mean + spread)
+    elif settings.latency_dist == 'normal':
+        latency = random.gauss(mean, spread)
+    else:
+        # Long-tailed like real APIs: the median is the mean setting, spread is sigma of the log
+        latency = random.lognormvariate(0, spread) * mean
+
+    return max(0.0, latency)
+
+def estimate_tokens(text):
+    """Estimate the number of tokens in a text (about 4 characters per token)"""
+    return len(text) // 4 + 1
+
+def check_rate_limits(tokens):
+    """
+    Record a request against the rate limits
+
+    Args:
+        tokens (int): Tokens the request uses
+
+    Returns:
+        float: Seconds until the request would fit, or None if it is accepted
+    """
+    now = time.time()
+    with rate_lock:
+        while request_times and now - request_times[0] >= 60:
+            request_times.popleft()
+        while token_usage and now - token_usage[0][0] >= 60:
+            token_usage.popleft()
+
+        if settings.rpm and len(request_times) >= settings.rpm:
+            return 60 - (now - request_times[0])
+
+        used = sum(count for _, count in token_usage)
+        if settings.tpm and token_usage and used + tokens > settings.tpm:
+            return 60 - (now - token_usage[0][0])
+
+        request_times.append(now)
+        token_usage.append((now, tokens))
+        return None
+
+def build_reply(messages):
+    """
+    Build the completion text: the opening words of the prompt's text, up to the response size
+
+    Args:
+        messages (list): Chat messages of the request
+
+    Returns:
+        list: Reply tokens (words with their trailing space)
+    """
+    prompt = messages[-1].get('content', '') if messages else ''
+    text = prompt.split("TEXT:", 1)[-1].split("SUMMARIES:", 1)[-1]
+    words = WORD_PATTERN.findall(text) or ["Summary."]
+
+    tokens = ["Summary:"]
+    while len(tokens) < settings.response_tokens:
+        tokens.extend(words[:settings.response_tokens - len(tokens)])
+    return [token + " " for token in tokens]
+
+def count(name, amount=1):
+    with stats_lock:
+        stats[name] += amount
+        stats['max_in_flight'] = max(stats['max_in_flight'], stats['in_flight'])
+
+def error_response(status, message, retry_after=None):
+    response = jsonify({'error': {'message': message, 'type': 'stub_error', 'code': status}})
+    response.status_code = status
+    if retry_after is not None:
+        response.headers['Retry-After'] = str(max(1, int(retry_after + 0.999)))
+    return response
+
+@app.route("/v1/chat/completions", methods=["POST"])
+def chat_completions():
+    count('requests')
+    payload = request.get_json(silent=True) or {}
+    messages = payload.get('messages', [])
+    model = payload.get('model', 'grok-2-latest')
+
+    prompt_tokens = sum(estimate_tokens(message.get('content', '')) for message in messages)
+    reply = build_reply(messages)
+    total_tokens = prompt_tokens + len(reply)
+
+    # Provider rate limits
+    retry_after = check_rate_limits(total_tokens)
+    if retry_after is not None:
+        count('rate_limited')
+        return error_response(429, "Rate limit exceeded", retry_after)
+
+    # Injected failures
+    roll = random.random()
+    if roll < settings.error_429:
+        count('rate_limited')
+        return error_response(429, "Rate limit exceeded (injected)", settings.retry_after)
+    if roll < settings.error_429 + settings.error_5xx:
+        count('server_errors')
+        return error_response(random.choice([500, 502, 503]), "Server error (injected)")
+
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    usage = {
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': len(reply),
+        'total_tokens': total_tokens,
+    }
+    token_delay = 1.0 / settings.tokens_per_sec if settings.tokens_per_sec else 0
+
+    if payload.get('stream'):
+        def events():
+            count('in_flight')
+            try:
+                time.sleep(sample_latency())
+                for token in reply:
+                    chunk = {
+                        'id': completion_id,
+                        'object': 'chat.completion.chunk',
+                        'created': created,
+                        'model': model,
+                        'choices': [{'index': 0, 'delta': {'content': token}, 'finish_reason': None}],
+                    }
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                    time.sleep(token_delay)
+
+                chunk = {
+                    'id': completion_id,
+                    'object': 'chat.completion.chunk',
+                    'created': created,
+                    'model': model,
+                    'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}],
+                    'usage': usage,
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+                yield "data: [DONE]\n\n"
+                count('completed')
+            finally:
+                count('in_flight', -1)
+
+        return Response(events(), mimetype="text/event-stream")
+
+    count('in_flight')
+    try:
+        time.sleep(sample_latency() + token_delay * len(reply))
+    finally:
+        count('in_flight', -1)
+    count('completed')
+
+    return jsonify({
+        'id': completion_id,
+        'object': 'chat.completion',
+        'created': created,
+        'model': model,
+        'choices': [{
+            'index': 0,
+            'message': {'role': 'assistant', 'content': "".join(reply).strip()},
+            'finish_reason': 'stop',
+        }],
+        'usage': usage,
+    })
+
+@app.route("/stats")
+def get_stats():
+    # Request counters since the server started
+    with stats_lock:
+        return jsonify(stats)
+
+def main():
+    """Main function"""
+    global settings
+
+    parser = argparse.ArgumentParser(description='Run a local Grok-compatible chat completions server')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8001, help='Port to listen on')
+    parser.add_argument('--latency-dist', choices=['fixed', 'uniform', 'normal', 'lognormal'], default='lognormal',
+                        help='Distribution of the time to first token')
+    parser.add_argument('--latency-mean', type=float, default=0.8, help='Mean (median for lognormal) time to first token in seconds')
+    parser.add_argument('--latency-spread', type=float, default=0.4,
+                        help='Half-width (uniform), standard deviation (normal) or log sigma (lognormal) of the latency')
+    parser.add_argument('--tokens-per-sec', type=float, default=60, help='Generation speed (0 for instant)')
+    parser.add_argument('--response-tokens', type=int, default=200, help='Tokens in each completion')
+    parser.add_argument('--error-429', type=float, default=0.0, help='Share of requests answered with an injected 429')
+    parser.add_argument('--error-5xx', type=float, default=0.0, help='Share of requests answered with an injected 5xx')
+    parser.add_argument('--retry-after', type=float, default=2.0, help='Retry-After seconds sent with injected 429s')
+    parser.add_argument('--rpm', type=int, default=0, help='Requests per minute limit (0 for none)')
+    parser.add_argument('--tpm', type=int, default=0, help='Tokens per minute limit (0 for none)')
+    parser.add_argument('--seed', type=int, help='Random seed for reproducible runs')
+
+    settings = parser.parse_args()
+
+    if settings.seed is not None:
+        random.seed(settings.seed)
+
+    print(f"Grok stub listening on http://{settings.host}:{settings.port}/v1/chat/completions")
+    app.run(host=settings.host, port=settings.port, threaded=True)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,22 @@
 import json
 import os
+import sys
 import base64
 import boto3
-from services.ocr_service import extract_text_from_pdf
-from services.summary_service import generate_summary
-from services.storage_service import save_file
 
-# Initialize S3 client
-s3 = boto3.client('s3')
+# The service modules import each other by bare name, so the handler imports them the same way;
+# importing them as services.x too would load second copies with their own S3 client and
+# transfer config
+SERVICES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pdf_processor', 'services')
+sys.path.insert(0, SERVICES_DIR)
+
+from ocr_service import extract_text_from_pdf
+from summary_service import generate_summary
+from storage_service import save_file, read_file, write_file
+from aws_clients import get_s3_client
+
+# Shared S3 client (the same one the storage service uses)
+s3 = get_s3_client()
 
 # Configure bucket names from environment variables
 PDF_BUCKET = os.environ.get('PDF_BUCKET', 'pdf-processor-pdfs')
@@ -18,6 +27,12 @@ SUMMARY_BUCKET = os.environ.get('SUMMARY_BUCKET', 'pdf-processor-summaries')
 dynamodb = boto3.resource('dynamodb')
 jobs_table = dynamodb.Table(os.environ.get('JOBS_TABLE', 'pdf-processor-jobs'))
 
+# Seconds between saves of the partial text while OCR is running
+PARTIAL_TEXT_INTERVAL = float(os.environ.get('PARTIAL_TEXT_INTERVAL', 10))
+
+# Seconds between job progress updates while OCR is running (the last page is always recorded)
+PROGRESS_UPDATE_INTERVAL = float(os.environ.get('PROGRESS_UPDATE_INTERVAL', 5))
+
 def lambda_handler(event, context):
     """AWS Lambda handler function for the PDF Processor application."""
     
@@ -246,16 +261,8 @@ def get_job_summary(job_id):
                 })
             }
         
-        bucket = match.group(1)
-        key = match.group(2)
-        
-        # Get summary from S3
-        response = s3.get_object(
-            Bucket=bucket,
-            Key=key
-        )
-        
-        summary = response['Body'].read().decode('utf-8')
+        # Get summary from S3 (read_file decompresses summaries stored compressed)
+        summary = read_file(summary_path).decode('utf-8')
         
         return {
             'statusCode': 200,
@@ -309,44 +316,78 @@ def handle_s3_event(event):
     
     job_id = parts[1]
     
-    # Update job status
+    # Page checkpoints and diagnostics go under the job's output prefix, named after the PDF
+    output_prefix = f"s3://{bucket}/output/{job_id}"
+    document_id = os.path.splitext(os.path.basename(key))[0]
+    
+    # Update job status, recording where the outputs go so the diagnostics can be served
     jobs_table.update_item(
         Key={
             'job_id': job_id
         },
-        UpdateExpression="set #status = :status, updated_at = :updated_at",
+        UpdateExpression="set #status = :status, output_prefix = :output_prefix, document_id = :document_id, updated_at = :updated_at",
         ExpressionAttributeNames={
             '#status': 'status'
         },
         ExpressionAttributeValues={
             ':status': 'ocr_processing',
+            ':output_prefix': output_prefix,
+            ':document_id': document_id,
             ':updated_at': int(time.time())
         }
     )
     
     try:
-        # Download file from S3
-        import tempfile
-        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp_file:
-            temp_path = temp_file.name
-            
-        s3.download_file(bucket, key, temp_path)
-        
-        # Process the PDF
-        extracted_text = extract_text_from_pdf(temp_path)
+        # Process the PDF straight from S3; the OCR service downloads it into memory once, recording progress as pages finish
+        text_key = f"text/{job_id}/{job_id}_extracted_text.txt"
+        pages = []
+        saved = {'pages': 0, 'time': 0.0, 'progress_time': 0.0}
         
-        # Clean up temp file
-        os.unlink(temp_path)
+        def on_page(page):
+            if page['markdown']:
+                pages.append(page['markdown'])
+            
+            # Save the partial text so far, at most every PARTIAL_TEXT_INTERVAL seconds
+            now = time.time()
+            text_saved = len(pages) > saved['pages'] and now - saved['time'] >= PARTIAL_TEXT_INTERVAL
+            if text_saved:
+                write_file(f"s3://{TEXT_BUCKET}/{text_key}", "\n\n".join(pages), 'text/plain')
+                saved.update(pages=len(pages), time=now)
+            
+            # One update per page would cost a DynamoDB write per page, so progress is recorded
+            # at most every PROGRESS_UPDATE_INTERVAL seconds, when new text was saved and on the last page
+            last_page = page['page_idx'] + 1 == page['pages_total']
+            if not (text_saved or last_page or now - saved['progress_time'] >= PROGRESS_UPDATE_INTERVAL):
+                return
+            saved['progress_time'] = now
+            
+            update_expression = "set pages_done = :pages_done, pages_total = :pages_total, updated_at = :updated_at"
+            values = {
+                ':pages_done': page['page_idx'] + 1,
+                ':pages_total': page['pages_total'],
+                ':updated_at': int(now)
+            }
+            if saved['pages']:
+                update_expression += ", text_path = :text_path"
+                values[':text_path'] = f"s3://{TEXT_BUCKET}/{text_key}"
+            
+            jobs_table.update_item(
+                Key={
+                    'job_id': job_id
+                },
+                UpdateExpression=update_expression,
+                ExpressionAttributeValues=values
+            )
         
-        # Save text to S3
-        text_key = f"text/{job_id}/{job_id}_extracted_text.txt"
-        s3.put_object(
-            Bucket=TEXT_BUCKET,
-            Key=text_key,
-            Body=extracted_text.encode('utf-8'),
-            ContentType='text/plain'
+        # Page checkpoints under the job's output prefix let a retry after a timeout
+        # skip the pages that are already done
+        extracted_text = extract_text_from_pdf(
+            f"s3://{bucket}/{key}", on_page=on_page, output_prefix=output_prefix
         )
         
+        # Save text to S3 (compressed like the app's artifacts; read_file decompresses it)
+        write_file(f"s3://{TEXT_BUCKET}/{text_key}", extracted_text, 'text/plain')
+        
         # Update job status
         jobs_table.update_item(
             Key={
@@ -368,12 +409,7 @@ def handle_s3_event(event):
         
         # Save summary to S3
         summary_key = f"summary/{job_id}/{job_id}_summary.txt"
-        s3.put_object(
-            Bucket=SUMMARY_BUCKET,
-            Key=summary_key,
-            Body=summary.encode('utf-8'),
-            ContentType='text/plain'
-        )
+        write_file(f"s3://{SUMMARY_BUCKET}/{summary_key}", summary, 'text/plain')
         
         # Update job status
         jobs_table.update_item(
@@ -1,11 +1,32 @@
+import io
 import os
+import sys
+import json
+import hashlib
+import time
 import uuid
-from flask import Flask, request, render_template, redirect, url_for, flash, jsonify
+from flask import Flask, request, render_template, redirect, url_for, flash, jsonify, send_file, Response, stream_with_context
 from werkzeug.utils import secure_filename
-from services.ocr_service import extract_text_from_pdf
-from services.summary_service import generate_summary
-from services.storage_service import save_file, read_file, write_file
-from services.message_service import MessageQueue
+
+# The service modules import each other by bare name, so the app imports them the same way;
+# importing them as services.x too would load second copies with their own clients, caches
+# and schedulers
+SERVICES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "services")
+sys.path.insert(0, SERVICES_DIR)
+
+# The OCR engine comes through ocr_service, so the pool warmed up here is the one jobs use
+from ocr_service import extract_text_from_pdf, get_ocr_engine
+from summary_service import generate_summary, stream_summary, get_summary_cache_stats, get_summary_cache_key
+from storage_service import save_file, read_file, open_buffer, write_file, delete_file, file_exists
+from pdf_utils import PdfPreflight, get_page_count
+from message_service import MessageQueue
+from diagnostics_service import get_diagnostic_pdf, DIAGNOSTIC_KINDS
+from stream_service import open_token_stream, get_token_stream, close_token_stream
+from singleflight import SingleFlight
+from summary_index import (
+    has_sections, build_summary_index, compose_summary, stream_composed_summary,
+    load_summary_index, save_summary_index, SUMMARY_LENGTHS
+)
 
 # Determine if we're running in AWS Lambda
 is_lambda = 'AWS_LAMBDA_FUNCTION_NAME' in os.environ
@@ -27,7 +48,19 @@ app.config["SUMMARY_FOLDER"] = os.environ.get(
     "SUMMARY_FOLDER",
     os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads/summaries")
 )
-app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024  # 16MB max upload size
+app.config["OUTPUT_FOLDER"] = os.environ.get(
+    "OUTPUT_FOLDER",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads/output")
+)
+# Uploads are streamed to storage in chunks, so large files don't need to fit in memory
+MAX_UPLOAD_MB = int(os.environ.get("MAX_UPLOAD_MB", 512))
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_MB * 1024 * 1024
+
+# Reject uploads with more pages than this (0 for no limit)
+MAX_UPLOAD_PAGES = int(os.environ.get("MAX_UPLOAD_PAGES", 0))
+
+# Seconds between saves of the partial text while OCR is running
+PARTIAL_TEXT_INTERVAL = float(os.environ.get("PARTIAL_TEXT_INTERVAL", 10))
 
 # Ensure upload directories exist (for local development)
 if not is_lambda:
@@ -35,6 +68,7 @@ if not is_lambda:
         app.config["UPLOAD_FOLDER"],
         app.config["TEXT_FOLDER"],
         app.config["SUMMARY_FOLDER"],
+        app.config["OUTPUT_FOLDER"],
     ]:
         os.makedirs(folder, exist_ok=True)
 
@@ -126,6 +160,26 @@ else:
 ocr_queue = MessageQueue()
 summary_queue = MessageQueue()
 
+# Jobs for the same PDF (or the same extracted text) that run at the same time share one OCR run (or LLM call)
+ocr_flight = SingleFlight()
+summary_flight = SingleFlight()
+
+# Parse methods accepted from the upload form
+PARSE_METHODS = ("auto", "ocr", "txt", "fast")
+
+# Stream summaries token by token; the partial summary is written to its file every SUMMARY_FLUSH_SECONDS
+SUMMARY_STREAMING = os.environ.get("SUMMARY_STREAMING", "true").lower() == "true"
+SUMMARY_FLUSH_SECONDS = float(os.environ.get("SUMMARY_FLUSH_SECONDS", 1.0))
+
+# Summarise documents with headings section by section, keeping the section summaries for variants
+SUMMARY_INDEX_ENABLED = os.environ.get("SUMMARY_INDEX_ENABLED", "true").lower() == "true"
+
+# Seconds between keep-alive comments on idle summary event streams
+SSE_KEEPALIVE_SECONDS = 15
+
+# Job statuses after which a summary stream has nothing more to send
+FINAL_STATUSES = ("completed", "ocr_failed", "summarization_failed")
+
 def allowed_file(filename):
     return "." in filename and filename.rsplit(".", 1)[1].lower() == "pdf"
 
@@ -149,17 +203,46 @@ def upload_file():
         # Generate a unique ID for this job
         job_id = str(uuid.uuid4())
         
-        # Create secure filename and save the file
+        # Create secure filename and stream the file to storage, checking it on the way
         filename = secure_filename(file.filename)
-        pdf_path = save_file(file, app.config["UPLOAD_FOLDER"], f"{job_id}_{filename}")
+        preflight = PdfPreflight()
+        pdf_path = save_file(file, app.config["UPLOAD_FOLDER"], f"{job_id}_{filename}", on_chunk=preflight.update)
+        
+        if not preflight.is_pdf:
+            delete_file(pdf_path)
+            flash("The file is not a valid PDF.")
+            return redirect(url_for("index"))
+            
+        # The preflight page count is only an estimate, so count the pages of the stored file
+        try:
+            with open_buffer(pdf_path) as pdf_bytes:
+                page_count = get_page_count(pdf_bytes)
+        except Exception as e:
+            print(f"Error reading uploaded PDF {pdf_path}: {e}")
+            delete_file(pdf_path)
+            flash("The file is not a valid PDF.")
+            return redirect(url_for("index"))
+        
+        if MAX_UPLOAD_PAGES and page_count > MAX_UPLOAD_PAGES:
+            delete_file(pdf_path)
+            flash(f"The PDF has {page_count} pages. Maximum is {MAX_UPLOAD_PAGES}.")
+            return redirect(url_for("index"))
         
         # Add job to tracking
         create_job(job_id, pdf_path, filename)
+        update_job(job_id, "uploaded", file_size=preflight.size, pages_done=0, pages_total=page_count)
         
         # Add to OCR processing queue
-        ocr_queue.add_message(
-            {"job_id": job_id, "pdf_path": pdf_path, "filename": filename}
-        )
+        parse_method = request.form.get("parse_method", "auto")
+        if parse_method not in PARSE_METHODS:
+            parse_method = "auto"
+        ocr_queue.add_message({
+            "job_id": job_id,
+            "pdf_path": pdf_path,
+            "filename": filename,
+            "parse_method": parse_method,
+            "pdf_sha256": preflight.hexdigest,
+        })
         
         # Start OCR processing in a non-blocking way
         process_ocr_queue()
@@ -203,6 +286,128 @@ def get_summary(job_id):
     
     return jsonify({"summary": summary})
 
+@app.route("/api/summary/<job_id>/variant")
+def get_summary_variant(job_id):
+    job = get_job(job_id)
+    
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+        
+    if not job.get("summary_index_path"):
+        return jsonify({"error": "Section summaries not available for this job"}), 400
+        
+    length = request.args.get("length", "medium")
+    if length not in SUMMARY_LENGTHS:
+        return jsonify({"error": f"Unknown length, use one of: {', '.join(SUMMARY_LENGTHS)}"}), 400
+    focus = request.args.get("focus") or None
+    
+    index = load_summary_index(job["summary_index_path"])
+    if index is None:
+        return jsonify({"error": "Section summaries not available for this job"}), 404
+        
+    # Composed from the saved section summaries, without re-reading the document
+    summary = compose_summary(index, focus=focus, length=length)
+    
+    return jsonify({"summary": summary, "focus": focus, "length": length})
+
+@app.route("/api/summary/<job_id>/stream")
+def stream_summary_events(job_id):
+    job = get_job(job_id)
+    
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+        
+    def events():
+        offset = 0
+        while True:
+            stream = get_token_stream(job_id)
+            
+            if stream:
+                # Relay tokens as this process generates them
+                text, done = stream.wait(offset, timeout=SSE_KEEPALIVE_SECONDS)
+            else:
+                # Generated elsewhere (or not started yet): relay the summary file as it grows
+                current = get_job(job_id) or {}
+                done = current.get("status") in FINAL_STATUSES
+                text = ""
+                if current.get("summary_path"):
+                    try:
+                        text = read_file(current["summary_path"]).decode('utf-8')[offset:]
+                    except Exception:
+                        text = ""
+                if not text and not done:
+                    time.sleep(SUMMARY_FLUSH_SECONDS)
+            
+            if text:
+                offset += len(text)
+                yield f"data: {json.dumps({'text': text})}\n\n"
+            elif not done:
+                yield ": keep-alive\n\n"
+            
+            if done:
+                break
+        
+        final_status = (get_job(job_id) or {}).get("status")
+        yield f"event: done\ndata: {json.dumps({'status': final_status})}\n\n"
+    
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.route("/api/text/<job_id>")
+def get_text(job_id):
+    job = get_job(job_id)
+    
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+        
+    if not job.get("text_path"):
+        return jsonify({"error": "Text not available yet"}), 400
+        
+    # Read the extracted text so far from file or S3
+    text = read_file(job["text_path"]).decode('utf-8')
+    
+    return jsonify({
+        "text": text,
+        "pages_done": job.get("pages_done"),
+        "pages_total": job.get("pages_total"),
+        "complete": job["status"] not in ("uploaded", "ocr_processing"),
+    })
+
+@app.route("/api/diagnostics/<job_id>/<kind>")
+def get_diagnostics(job_id, kind):
+    job = get_job(job_id)
+    
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+        
+    if kind not in DIAGNOSTIC_KINDS:
+        return jsonify({"error": f"Unknown diagnostic, use one of: {', '.join(DIAGNOSTIC_KINDS)}"}), 404
+        
+    if not job.get("output_prefix"):
+        return jsonify({"error": "Diagnostics not available yet"}), 400
+        
+    # Render the overlay on first request, then serve it from file or S3
+    try:
+        diagnostic_path = get_diagnostic_pdf(
+            job["pdf_path"], job["output_prefix"], kind, document_id=job.get("document_id")
+        )
+    except FileNotFoundError:
+        return jsonify({"error": "Diagnostics not available for this job"}), 404
+        
+    return send_file(
+        io.BytesIO(read_file(diagnostic_path)),
+        mimetype="application/pdf",
+        download_name=f"{job_id}_{kind}.pdf",
+    )
+
+@app.route("/api/cache/summary")
+def get_summary_cache():
+    # Hit and miss counters of this process's summary cache
+    return jsonify(get_summary_cache_stats())
+
 def process_ocr_queue():
     """
     Process the OCR queue in a non-blocking way
@@ -215,6 +420,7 @@ def process_ocr_queue():
             message = ocr_queue.get_message()
             job_id = message["job_id"]
             pdf_path = message["pdf_path"]
+            parse_method = message.get("parse_method", "auto")
             
             try:
                 # Update job status
@@ -224,20 +430,68 @@ def process_ocr_queue():
                 text_filename = f"{job_id}_extracted_text.txt"
                 text_path = os.path.join(app.config["TEXT_FOLDER"], text_filename)
                 
+                # OCR outputs and page checkpoints, so a retried job resumes where it stopped
+                output_prefix = os.path.join(app.config["OUTPUT_FOLDER"], job_id)
+                
                 # If using S3, create appropriate S3 path
                 if is_lambda and pdf_path.startswith('s3://'):
                     parts = pdf_path[5:].split('/', 1)
                     bucket = parts[0]
                     text_path = f"s3://{bucket}/text/{job_id}/{text_filename}"
+                    output_prefix = f"s3://{bucket}/output/{job_id}"
+                
+                # Identical PDFs uploaded at the same time share one OCR run
+                pdf_hash = message.get("pdf_sha256")
+                if not pdf_hash:
+                    with open_buffer(pdf_path) as pdf_bytes:
+                        pdf_hash = hashlib.sha256(pdf_bytes).hexdigest()
+                flight_key = f"{pdf_hash}-{parse_method}"
+                
+                def run_ocr():
+                    # Perform OCR page by page, saving partial text as pages finish
+                    pages = []
+                    saved = {"pages": 0, "time": 0.0}
+                    
+                    def on_page(page):
+                        progress = {
+                            "pages_done": page["page_idx"] + 1,
+                            "pages_total": page["pages_total"],
+                        }
+                        if page["markdown"]:
+                            pages.append(page["markdown"])
+                        
+                        # Rewriting the text on every page would cost one PUT per page,
+                        # so new pages are saved at most every PARTIAL_TEXT_INTERVAL seconds
+                        now = time.time()
+                        if len(pages) > saved["pages"] and now - saved["time"] >= PARTIAL_TEXT_INTERVAL:
+                            write_file(text_path, "\n\n".join(pages))
+                            saved.update(pages=len(pages), time=now)
+                        if saved["pages"]:
+                            progress["text_path"] = text_path
+                        
+                        # Report progress on every job waiting for this run
+                        for waiting_job_id in ocr_flight.callers(flight_key):
+                            update_job(waiting_job_id, "ocr_processing", **progress)
+                    
+                    extracted_text = extract_text_from_pdf(
+                        pdf_path, parse_method, on_page=on_page, output_prefix=output_prefix
+                    )
+                    # The outputs are named after the PDF of the job that ran OCR
+                    document_id = os.path.splitext(os.path.basename(pdf_path))[0]
+                    return extracted_text, output_prefix, document_id
                 
-                # Perform OCR
-                extracted_text = extract_text_from_pdf(pdf_path)
+                (extracted_text, output_prefix, document_id), shared = ocr_flight.do(flight_key, run_ocr, job_id)
+                if shared:
+                    print(f"Job {job_id} reused the OCR run of an identical upload")
                 
                 # Save extracted text
                 write_file(text_path, extracted_text)
                 
                 # Update job status
-                update_job(job_id, "ocr_completed", text_path=text_path)
+                update_job(
+                    job_id, "ocr_completed",
+                    text_path=text_path, output_prefix=output_prefix, document_id=document_id
+                )
                 
                 # Add to summary processing queue
                 summary_queue.add_message({"job_id": job_id, "text_path": text_path})
@@ -272,10 +526,7 @@ def process_summary_queue():
                 # Read extracted text
                 extracted_text = read_file(text_path).decode('utf-8')
                 
-                # Generate summary
-                summary = generate_summary(extracted_text)
-                
-                # Save summary
+                # Summary file location
                 summary_filename = f"{job_id}_summary.txt"
                 summary_path = os.path.join(
                     app.config["SUMMARY_FOLDER"], summary_filename
@@ -287,10 +538,46 @@ def process_summary_queue():
                     bucket = parts[0]
                     summary_path = f"s3://{bucket}/summary/{job_id}/{summary_filename}"
                 
+                # Jobs with the same text summarising at the same time share one summary
+                flight_key = get_summary_cache_key(extracted_text)
+                
+                def run_summary():
+                    # Point every waiting job at the summary as it is generated
+                    for waiting_job_id in summary_flight.callers(flight_key):
+                        update_job(waiting_job_id, "summarizing", summary_path=summary_path)
+                    
+                    # Documents with headings are summarised section by section; the
+                    # saved section summaries are reused for variants and new versions
+                    index_path = None
+                    if SUMMARY_INDEX_ENABLED and has_sections(extracted_text):
+                        index_path = summary_path.replace("_summary.txt", "_summary_index.json")
+                        
+                        # A job summarised before (e.g. a retry) only summarises its changed sections again
+                        previous = load_summary_index(index_path) if file_exists(index_path) else None
+                        index = build_summary_index(extracted_text, previous=previous)
+                        save_summary_index(index_path, index)
+                        
+                        if SUMMARY_STREAMING:
+                            summary = stream_summary_to_file(job_id, stream_composed_summary(index), summary_path)
+                        else:
+                            summary = compose_summary(index)
+                    
+                    # Generate summary
+                    elif SUMMARY_STREAMING:
+                        summary = stream_summary_to_file(job_id, stream_summary(extracted_text), summary_path)
+                    else:
+                        summary = generate_summary(extracted_text)
+                    
+                    return summary, index_path
+                
+                (summary, index_path), shared = summary_flight.do(flight_key, run_summary, job_id)
+                if shared:
+                    print(f"Job {job_id} reused the summary of an identical document")
+                
                 write_file(summary_path, summary)
                 
                 # Update job status
-                update_job(job_id, "completed", summary_path=summary_path)
+                update_job(job_id, "completed", summary_path=summary_path, summary_index_path=index_path)
             except Exception as e:
                 update_job(job_id, "summarization_failed", error=str(e))
                 print(f"Summarization error: {e}")
@@ -299,6 +586,42 @@ def process_summary_queue():
     thread.daemon = True
     thread.start()
 
+def stream_summary_to_file(job_id, tokens, summary_path):
+    """
+    Consume a summary stream, relaying tokens to /api/summary/<job_id>/stream
+    and writing the partial summary to summary_path as it grows
+    
+    Args:
+        job_id (str): Job ID
+        tokens (iterable): Pieces of the summary, e.g. from stream_summary
+        summary_path (str): Path of the summary file (S3 URI or local path)
+        
+    Returns:
+        str: The complete summary
+    """
+    stream = open_token_stream(job_id)
+    
+    parts = []
+    last_flush = time.time()
+    try:
+        for token in tokens:
+            parts.append(token)
+            stream.append(token)
+            
+            if time.time() - last_flush >= SUMMARY_FLUSH_SECONDS:
+                write_file(summary_path, "".join(parts))
+                last_flush = time.time()
+    finally:
+        close_token_stream(job_id)
+    
+    return "".join(parts)
+
 # This main block only runs in development, not in Lambda
 if __name__ == "__main__":
+    # Load the OCR models in the worker processes before the first upload arrives.
+    # Only the reloader's serving process starts the pool; otherwise it starts on first use.
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        import threading
+        threading.Thread(target=get_ocr_engine().start, daemon=True).start()
+    
     app.run(debug=True, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -24,7 +24,7 @@ class Config:
     SUMMARY_FOLDER = os.path.join(
         os.path.dirname(os.path.abspath(__file__)), "uploads/summaries"
     )
-    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max upload size
+    MAX_CONTENT_LENGTH = int(os.environ.get("MAX_UPLOAD_MB", 512)) * 1024 * 1024  # uploads are streamed to storage
 
     # API settings
     GROK_API_URL = os.environ.get(
@@ -0,0 +1,71 @@
+import os
+import threading
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+
+MB = 1024 * 1024
+
+# Connections kept open to S3; should cover the worker threads times S3_MAX_CONCURRENCY
+S3_MAX_POOL_CONNECTIONS = int(os.environ.get('S3_MAX_POOL_CONNECTIONS', 50))
+
+# Retries of throttled and failed S3 calls ('adaptive' also rate limits the client on throttling)
+S3_RETRY_MODE = os.environ.get('S3_RETRY_MODE', 'adaptive')
+S3_MAX_ATTEMPTS = int(os.environ.get('S3_MAX_ATTEMPTS', 10))
+
+S3_CONNECT_TIMEOUT = float(os.environ.get('S3_CONNECT_TIMEOUT', 5))
+S3_READ_TIMEOUT = float(os.environ.get('S3_READ_TIMEOUT', 60))
+
+# Files above the threshold are uploaded and downloaded as parallel parts of the chunk size
+S3_MULTIPART_THRESHOLD = int(os.environ.get('S3_MULTIPART_THRESHOLD_MB', 8)) * MB
+S3_MULTIPART_CHUNKSIZE = int(os.environ.get('S3_MULTIPART_CHUNKSIZE_MB', 8)) * MB
+S3_MAX_CONCURRENCY = int(os.environ.get('S3_MAX_CONCURRENCY', 10))
+
+_lock = threading.Lock()
+_s3_client = None
+_transfer_config = None
+
+def get_s3_client():
+    """
+    Get the shared S3 client
+
+    The client is created once per process, with a connection pool sized for
+    the worker threads and adaptive retries, and is safe to share between threads.
+
+    Returns:
+        The boto3 S3 client
+    """
+    global _s3_client
+    if _s3_client is not None:
+        return _s3_client
+
+    # Creating clients from the default session is not thread-safe
+    with _lock:
+        if _s3_client is None:
+            config = Config(
+                max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+                retries={'mode': S3_RETRY_MODE, 'total_max_attempts': S3_MAX_ATTEMPTS},
+                connect_timeout=S3_CONNECT_TIMEOUT,
+                read_timeout=S3_READ_TIMEOUT,
+            )
+            _s3_client = boto3.session.Session().client('s3', config=config)
+        return _s3_client
+
+def get_transfer_config():
+    """
+    Get the multipart settings for S3 uploads and downloads (upload_file,
+    upload_fileobj, download_file and download_fileobj)
+
+    Returns:
+        TransferConfig: Shared transfer settings
+    """
+    global _transfer_config
+    if _transfer_config is None:
+        _transfer_config = TransferConfig(
+            multipart_threshold=S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=S3_MULTIPART_CHUNKSIZE,
+            max_concurrency=S3_MAX_CONCURRENCY,
+            use_threads=S3_MAX_CONCURRENCY > 1,
+        )
+    return _transfer_config
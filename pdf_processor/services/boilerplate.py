@@ -0,0 +1,172 @@
+import os
+import re
+import hashlib
+
+# MinerU imports
+from magic_pdf.config.make_content_config import MakeMode, DropMode
+from magic_pdf.dict2md.ocr_mkcontent import union_make
+
+# Remove repeated headers, footers, page numbers and watermarks from extracted text
+BOILERPLATE_ENABLED = os.environ.get('BOILERPLATE_ENABLED', 'true').lower() == 'true'
+
+# A block in the top or bottom margin is boilerplate once it repeats on this many pages
+BOILERPLATE_MIN_PAGES = int(os.environ.get('BOILERPLATE_MIN_PAGES', 3))
+
+# A block in the body of the page (e.g. a watermark) must repeat at the same
+# position on this share of the pages
+BOILERPLATE_BODY_RATIO = float(os.environ.get('BOILERPLATE_BODY_RATIO', 0.5))
+
+# Share of the page height at the top and bottom treated as header and footer margins
+MARGIN_RATIO = 0.1
+
+# Longer blocks are real content even when repeated
+MAX_BOILERPLATE_CHARS = 300
+
+# Lines at the start and end of a text-layer page treated as header and footer
+MARGIN_LINES = 2
+
+# Text-layer pages need this many lines besides the margins to have margins at all
+MIN_BODY_LINES = 4
+
+# Image and table blocks are never treated as boilerplate
+TEXT_BLOCK_TYPES = ('text', 'title')
+
+DIGITS_PATTERN = re.compile(r"\d+")
+
+# Short lines that are just a page number, e.g. "3", "- 3 -", "Page 3 of 10", "p. 3/10"
+PAGE_NUMBER_PATTERN = re.compile(r"^\W*(page|p\.?)?\s*\d+\s*((of|/)\s*\d+)?\W*$", re.IGNORECASE)
+
+def remove_boilerplate(pages, image_dir="images"):
+    """
+    Remove blocks that repeat across pages, such as running headers, footers,
+    page numbers and watermarks
+
+    Pages with OCR layout use the position of each block on the page; text-layer
+    pages use their first and last lines. Blocks are matched by a hash of their
+    normalised text (numbers ignored in page numbers, so "Page 3 of 10" matches
+    "Page 4 of 10") and position, so the cost grows linearly with the number of pages.
+    A page is never emptied: if every block of a page repeats, it is kept as it is.
+
+    Args:
+        pages (list): Page dicts with 'markdown' and, for OCR pages, 'page_info'
+            (the page's middle_json entry)
+        image_dir (str): Image folder used in the markdown
+
+    Returns:
+        list: Markdown of each page with the boilerplate removed, in page order
+    """
+    if not BOILERPLATE_ENABLED or len(pages) < BOILERPLATE_MIN_PAGES:
+        return [page["markdown"] for page in pages]
+
+    # Blocks of each page as (key, block) pairs, and the number of pages each key appears on
+    page_blocks = []
+    page_counts = {}
+    for page in pages:
+        blocks = _get_blocks(page)
+        page_blocks.append(blocks)
+        for key in {key for key, _ in blocks if key is not None}:
+            page_counts[key] = page_counts.get(key, 0) + 1
+
+    min_body_pages = max(BOILERPLATE_MIN_PAGES, len(pages) * BOILERPLATE_BODY_RATIO)
+    repeated = {
+        key for key, count in page_counts.items()
+        if count >= (BOILERPLATE_MIN_PAGES if key[0] in ('top', 'bottom') else min_body_pages)
+    }
+    if not repeated:
+        return [page["markdown"] for page in pages]
+
+    removed = 0
+    cleaned = []
+    for page, blocks in zip(pages, page_blocks):
+        kept = [block for key, block in blocks if key not in repeated]
+
+        # Keep pages that would lose all their content (e.g. slides that repeat a title)
+        if not any(_has_content(block) for block in kept):
+            cleaned.append(page["markdown"])
+            continue
+        removed += len(blocks) - len(kept)
+
+        if page.get("page_info"):
+            page_info = dict(page["page_info"], para_blocks=kept)
+            cleaned.append(union_make([page_info], MakeMode.MM_MD, DropMode.NONE, image_dir))
+        else:
+            cleaned.append("\n".join(kept).strip())
+
+    print(f"Removed {removed} boilerplate blocks from {len(pages)} pages")
+    return cleaned
+
+def _get_blocks(page):
+    """
+    Get the blocks of a page with their boilerplate keys
+
+    Returns:
+        list: (key, block) pairs in page order, where key is None for blocks that
+            can't be boilerplate and block is a para_block or a line of text
+    """
+    page_info = page.get("page_info")
+
+    if page_info:
+        width, height = page_info.get("page_size") or (0, 0)
+        blocks = []
+        for block in page_info.get("para_blocks", []):
+            key = None
+            text = _get_block_text(block)
+            if block.get("type") in TEXT_BLOCK_TYPES and text and width and height:
+                key = _get_key(text, _get_zone(block["bbox"], width, height))
+            blocks.append((key, block))
+        return blocks
+
+    # Text-layer pages have no positions; use the first and last lines as margins,
+    # when the page has enough lines for them to be different from the body
+    lines = (page["markdown"] or "").split("\n")
+    text_lines = [index for index, line in enumerate(lines) if line.strip()]
+    top = bottom = set()
+    if len(text_lines) >= 2 * MARGIN_LINES + MIN_BODY_LINES:
+        top = set(text_lines[:MARGIN_LINES])
+        bottom = set(text_lines[-MARGIN_LINES:])
+
+    blocks = []
+    for index, line in enumerate(lines):
+        key = None
+        if index in top:
+            key = _get_key(line.strip(), "top")
+        elif index in bottom:
+            key = _get_key(line.strip(), "bottom")
+        blocks.append((key, line))
+    return blocks
+
+def _has_content(block):
+    # Whether a para_block or a line of a text-layer page has anything to keep
+    if isinstance(block, str):
+        return bool(block.strip())
+    return block.get("type") not in TEXT_BLOCK_TYPES or bool(_get_block_text(block))
+
+def _get_block_text(block):
+    # Concatenated span content of a para_block
+    return " ".join(
+        span.get("content", "")
+        for line in block.get("lines", [])
+        for span in line.get("spans", [])
+    ).strip()
+
+def _get_zone(bbox, width, height):
+    # Header and footer margins, or a coarse grid cell in the body of the page
+    x0, y0, x1, y1 = bbox
+    center_y = (y0 + y1) / 2 / height
+    if center_y < MARGIN_RATIO:
+        return "top"
+    if center_y > 1 - MARGIN_RATIO:
+        return "bottom"
+    center_x = (x0 + x1) / 2 / width
+    return f"body-{int(center_y * 10)}-{int(center_x * 5)}"
+
+def _get_key(text, zone):
+    # Hash of the normalised text and its zone, or None for long blocks.
+    # Numbers are only ignored in page numbers in the margins, so lines that
+    # differ by their figures (e.g. "Revenue 2019" and "Revenue 2020") stay apart.
+    if len(text) > MAX_BOILERPLATE_CHARS:
+        return None
+    normalized = " ".join(text.lower().split())
+    if zone in ('top', 'bottom') and PAGE_NUMBER_PATTERN.match(normalized):
+        normalized = DIGITS_PATTERN.sub("#", normalized)
+    return (zone, hashlib.blake2b(normalized.encode('utf-8'), digest_size=8).digest())
@@ -0,0 +1,171 @@
+import json
+import time
+import threading
+from collections import OrderedDict
+from storage_service import get_file_path, read_file, write_file, delete_file, list_files
+
+class StorageCache:
+    """
+    A JSON result cache stored through the storage service, so entries live in a
+    local folder for development and in S3 when running in AWS Lambda.
+    Entries are evicted when they exceed a maximum age, and the oldest entries
+    are evicted first once the cache grows past a maximum total size.
+    """
+    def __init__(self, folder, max_bytes=None, max_age=None, evict_interval=300):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.evict_interval = evict_interval
+        self.lock = threading.Lock()
+        self.last_eviction = 0
+
+    def get_path(self, key):
+        """
+        Get the storage path of a cache entry
+
+        Args:
+            key (str): Cache key
+
+        Returns:
+            str: Full path to the entry (S3 URI or local path)
+        """
+        return get_file_path(self.folder, f"{key}.json")
+
+    def get(self, key):
+        """
+        Get a cached value
+
+        Args:
+            key (str): Cache key
+
+        Returns:
+            The cached value, or None if the entry is missing or expired
+        """
+        path = self.get_path(key)
+
+        try:
+            entry = json.loads(read_file(path).decode('utf-8'))
+        except Exception:
+            # Missing or unreadable entries are treated as misses
+            return None
+
+        # Drop entries that are older than the maximum age
+        if self.max_age and time.time() - entry.get('created_at', 0) > self.max_age:
+            delete_file(path)
+            return None
+
+        return entry.get('value')
+
+    def put(self, key, value):
+        """
+        Store a value in the cache
+
+        Args:
+            key (str): Cache key
+            value: JSON-serialisable value to store
+
+        Returns:
+            str: Path to the stored entry
+        """
+        entry = {
+            'key': key,
+            'created_at': time.time(),
+            'value': value
+        }
+        path = write_file(
+            self.get_path(key),
+            json.dumps(entry, ensure_ascii=False),
+            "application/json"
+        )
+
+        # Keep the cache within its size and age limits
+        self.evict()
+        return path
+
+    def evict(self, force=False):
+        """
+        Remove expired entries, then the oldest entries until the cache fits its size limit
+
+        Args:
+            force (bool): Run even if the last eviction was less than evict_interval seconds ago
+
+        Returns:
+            int: Number of entries removed
+        """
+        with self.lock:
+            now = time.time()
+            if not force and now - self.last_eviction < self.evict_interval:
+                return 0
+            self.last_eviction = now
+
+        try:
+            entries = sorted(list_files(self.folder), key=lambda e: e['modified'])
+        except Exception as e:
+            print(f"Error listing cache folder {self.folder}: {e}")
+            return 0
+
+        removed = 0
+        total_bytes = sum(e['size'] for e in entries)
+
+        for entry in entries:
+            expired = self.max_age and now - entry['modified'] > self.max_age
+            oversized = self.max_bytes and total_bytes > self.max_bytes
+            if not expired and not oversized:
+                # Entries are sorted oldest first, so the rest are within limits
+                break
+            if delete_file(entry['path']):
+                removed += 1
+                total_bytes -= entry['size']
+
+        if removed:
+            print(f"Evicted {removed} entries from cache {self.folder}")
+        return removed
+
+class LRUCache:
+    """
+    A thread-safe in-memory cache that keeps the most recently used entries.
+    Entries are evicted when they exceed a maximum age, and the least recently
+    used entry is evicted once the cache holds more than max_entries entries.
+    """
+    def __init__(self, max_entries=256, max_age=None):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        """
+        Get a cached value
+
+        Args:
+            key (str): Cache key
+
+        Returns:
+            The cached value, or None if the entry is missing or expired
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+            created_at, value = entry
+            if self.max_age and time.time() - created_at > self.max_age:
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        """
+        Store a value in the cache
+
+        Args:
+            key (str): Cache key
+            value: Value to store
+        """
+        with self.lock:
+            self.entries[key] = (time.time(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
@@ -0,0 +1,156 @@
+import os
+import gzip
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Compression of stored text and JSON: 'zstd' (gzip if zstandard isn't installed), 'gzip' or 'none'
+STORAGE_COMPRESSION = os.environ.get('STORAGE_COMPRESSION', 'zstd').lower()
+ZSTD_LEVEL = int(os.environ.get('ZSTD_LEVEL', 3))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', 6))
+
+# Content smaller than this is stored as it is
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', 512))
+
+# Optional zstd dictionary trained on our own artifacts (see train_compression_dictionary.py),
+# used to compress new content
+ZSTD_DICT_PATH = os.environ.get('ZSTD_DICT_PATH')
+
+# Dictionaries that older files were compressed with, separated by os.pathsep. Files record the
+# ID of their dictionary, so keep every past dictionary listed here after rotating ZSTD_DICT_PATH.
+ZSTD_READ_DICT_PATHS = [path for path in os.environ.get('ZSTD_READ_DICT_PATHS', '').split(os.pathsep) if path]
+
+# Content types that are compressed
+COMPRESSIBLE_TYPES = ('text/', 'application/json')
+
+def _load_dictionary(path):
+    with open(path, 'rb') as f:
+        return zstandard.ZstdCompressionDict(f.read())
+
+_zstd_dict = None
+# Every loaded dictionary by ID, for reading
+_zstd_dicts = {}
+if zstandard is not None:
+    for path in ZSTD_READ_DICT_PATHS:
+        dictionary = _load_dictionary(path)
+        _zstd_dicts[dictionary.dict_id()] = dictionary
+    if ZSTD_DICT_PATH:
+        _zstd_dict = _load_dictionary(ZSTD_DICT_PATH)
+        _zstd_dict.precompute_compress(level=ZSTD_LEVEL)
+        _zstd_dicts[_zstd_dict.dict_id()] = _zstd_dict
+
+# zstd compressors and decompressors can't be shared between threads
+_local = threading.local()
+
+def get_encoding():
+    """
+    Get the encoding new content is compressed with
+
+    Returns:
+        str: 'zstd', 'gzip' or None if compression is off
+    """
+    if STORAGE_COMPRESSION == 'zstd':
+        return 'zstd' if zstandard is not None else 'gzip'
+    if STORAGE_COMPRESSION == 'gzip':
+        return 'gzip'
+    return None
+
+def compress(content, content_type=None):
+    """
+    Compress content for storage if it is text or JSON
+
+    Args:
+        content (bytes): Content to store
+        content_type (str, optional): Content type of the content
+
+    Returns:
+        tuple: (data, encoding) where encoding is 'zstd', 'gzip' or None if
+            the content is stored as it is
+    """
+    encoding = get_encoding()
+    if (encoding is None or len(content) < COMPRESSION_MIN_BYTES
+            or not content_type or not content_type.startswith(COMPRESSIBLE_TYPES)):
+        return content, None
+
+    if encoding == 'zstd':
+        return _get_zstd_compressor().compress(content), 'zstd'
+    return gzip.compress(content, compresslevel=GZIP_LEVEL, mtime=0), 'gzip'
+
+def decompress(data, encoding, dictionary_id=None):
+    """
+    Decompress content written by compress
+
+    The encoding must come from where the content was stored (S3 metadata or
+    the local file header), since content stored as it is may itself look
+    compressed, e.g. a .gz upload.
+
+    Args:
+        data (bytes): Content as stored
+        encoding (str): Encoding compress returned; content with no encoding
+            (or one compress doesn't produce) is returned unchanged
+        dictionary_id (int, optional): ID of the zstd dictionary the content was
+            compressed with. If None, the ID recorded in the zstd frame is used.
+
+    Returns:
+        bytes: The original content
+    """
+    if encoding == 'gzip':
+        return gzip.decompress(data)
+    if encoding != 'zstd':
+        return data
+
+    if zstandard is None:
+        raise RuntimeError("zstandard is required to read zstd-compressed files")
+    if dictionary_id is None:
+        dictionary_id = zstandard.get_frame_parameters(data).dict_id
+    return _get_zstd_decompressor(int(dictionary_id)).decompress(data)
+
+def get_dictionary_id():
+    """
+    Get the ID of the zstd dictionary in use
+
+    Returns:
+        int: Dictionary ID, or 0 if no dictionary is loaded
+    """
+    return _zstd_dict.dict_id() if _zstd_dict is not None else 0
+
+def train_dictionary(samples, dict_size=112640):
+    """
+    Train a zstd dictionary on sample artifacts
+
+    A dictionary helps most with small files, such as page checkpoints,
+    cache entries and summaries, which are too short for zstd to learn from.
+
+    Args:
+        samples (list): Sample contents (bytes), ideally hundreds of them
+        dict_size (int): Maximum dictionary size in bytes
+
+    Returns:
+        bytes: The dictionary, to save to the file ZSTD_DICT_PATH points at
+    """
+    if zstandard is None:
+        raise RuntimeError("zstandard is required to train a dictionary")
+    return zstandard.train_dictionary(dict_size, samples, level=ZSTD_LEVEL).as_bytes()
+
+def _get_zstd_compressor():
+    compressor = getattr(_local, 'compressor', None)
+    if compressor is None:
+        compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=_zstd_dict)
+        _local.compressor = compressor
+    return compressor
+
+def _get_zstd_decompressor(dictionary_id):
+    decompressors = getattr(_local, 'decompressors', None)
+    if decompressors is None:
+        decompressors = _local.decompressors = {}
+
+    decompressor = decompressors.get(dictionary_id)
+    if decompressor is None:
+        if dictionary_id and dictionary_id not in _zstd_dicts:
+            raise RuntimeError(f"zstd dictionary {dictionary_id} is not loaded; add it to ZSTD_READ_DICT_PATHS")
+        decompressor = zstandard.ZstdDecompressor(dict_data=_zstd_dicts.get(dictionary_id))
+        decompressors[dictionary_id] = decompressor
+    return decompressor
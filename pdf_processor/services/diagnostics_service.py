@@ -0,0 +1,72 @@
+import os
+import json
+import tempfile
+from storage_service import read_file, open_buffer, write_file, file_exists, join_path
+from ocr_engine import open_dataset
+
+# MinerU imports
+from magic_pdf.operators.models import InferenceResult
+from magic_pdf.operators.pipes import PipeResult
+
+# Overlays that can be rendered on the PDF
+DIAGNOSTIC_KINDS = ('model', 'layout', 'span')
+
+def get_diagnostic_pdf(pdf_path, output_prefix, kind, document_id=None):
+    """
+    Get an annotated PDF showing the model, layout or span output of an OCR run
+
+    The PDF is rendered from the model output and middle JSON saved by the OCR
+    stage the first time it is requested, and cached under the output prefix.
+
+    Args:
+        pdf_path (str): Path to the original PDF file (S3 URI or local path)
+        output_prefix (str): Folder or S3 prefix the OCR outputs were saved to
+        kind (str): One of DIAGNOSTIC_KINDS
+        document_id (str, optional): Name the OCR outputs were saved under, if the OCR
+            ran on another copy of the PDF. If None, taken from pdf_path.
+
+    Returns:
+        str: Path to the annotated PDF (S3 URI or local path)
+
+    Raises:
+        FileNotFoundError: If the OCR data for the overlay was not saved
+    """
+    if kind not in DIAGNOSTIC_KINDS:
+        raise ValueError(f"Unknown diagnostic kind: {kind}")
+
+    if document_id is None:
+        document_id = os.path.splitext(os.path.basename(pdf_path))[0]
+    diagnostic_path = join_path(output_prefix, "diagnostics", f"{document_id}_{kind}.pdf")
+
+    # Serve previously rendered overlays
+    if file_exists(diagnostic_path):
+        return diagnostic_path
+
+    # The model overlay needs the model output, the others the middle json
+    if kind == 'model':
+        data_path = join_path(output_prefix, f"{document_id}_model.json")
+    else:
+        data_path = join_path(output_prefix, f"{document_id}_middle.json")
+
+    if not file_exists(data_path):
+        raise FileNotFoundError(f"No OCR data found at {data_path}")
+
+    data = json.loads(read_file(data_path).decode('utf-8'))
+
+    print(f"Rendering {kind} diagnostics for {pdf_path}")
+    with open_buffer(pdf_path) as pdf_bytes, open_dataset(pdf_bytes) as ds:
+        # MinerU draws the overlays to a file path
+        with tempfile.TemporaryDirectory() as temp_dir:
+            rendered_path = os.path.join(temp_dir, f"{document_id}_{kind}.pdf")
+
+            if kind == 'model':
+                InferenceResult(data, ds).draw_model(rendered_path)
+            elif kind == 'layout':
+                PipeResult(data, ds).draw_layout(rendered_path)
+            else:
+                PipeResult(data, ds).draw_span(rendered_path)
+
+            with open(rendered_path, 'rb') as f:
+                write_file(diagnostic_path, f.read(), "application/pdf")
+
+    return diagnostic_path
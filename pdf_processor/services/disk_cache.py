@@ -0,0 +1,208 @@
+import os
+import json
+import mmap
+import hashlib
+import tempfile
+import threading
+
+# Objects larger than this share of the cache are not cached
+MAX_ENTRY_RATIO = 0.25
+
+# Eviction removes files until the cache is this share of its maximum size
+EVICT_TARGET_RATIO = 0.9
+
+class DiskCache:
+    """
+    Copies of S3 objects in a local folder, each stored with the ETag it had
+    when it was fetched so it can be revalidated with If-None-Match, and with
+    the metadata needed to read it (such as its compression). Files are
+    replaced atomically, so several processes on a node can share the folder.
+    The least recently used files are removed once the folder grows past
+    max_bytes.
+    """
+    def __init__(self, folder, max_bytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+        self.total_bytes = sum(size for _, _, size in self._scan())
+
+    def get_path(self, uri):
+        """
+        Get the local path of a cached object
+
+        Args:
+            uri (str): S3 URI of the object
+
+        Returns:
+            str: Path of the cache file
+        """
+        return os.path.join(self.folder, hashlib.sha256(uri.encode('utf-8')).hexdigest())
+
+    def read(self, uri):
+        """
+        Read a cached object
+
+        Args:
+            uri (str): S3 URI of the object
+
+        Returns:
+            tuple: (etag, content, metadata), or None if the object is not cached
+        """
+        path = self.get_path(uri)
+        try:
+            with open(path, 'rb') as f:
+                header = _parse_header(f.readline())
+                if header is None:
+                    return None
+                content = f.read()
+        except OSError:
+            return None
+
+        self._touch(path)
+        etag, metadata = header
+        return etag, content, metadata
+
+    def map(self, uri):
+        """
+        Memory-map a cached object
+
+        Args:
+            uri (str): S3 URI of the object
+
+        Returns:
+            tuple: (etag, mapped file, offset of the content in it), or None if
+                the object is not cached
+        """
+        path = self.get_path(uri)
+        try:
+            with open(path, 'rb') as f:
+                header = f.readline()
+                if _parse_header(header) is None:
+                    return None
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        self._touch(path)
+        return _parse_header(header)[0], mapped, len(header)
+
+    def put(self, uri, etag, content, metadata=None):
+        """
+        Store an object with its ETag
+
+        Args:
+            uri (str): S3 URI of the object
+            etag (str): ETag returned by S3 for this content
+            content (bytes-like): Object content
+            metadata (dict, optional): JSON-serialisable details returned with it by read
+        """
+        if not etag or len(content) > self.max_bytes * MAX_ENTRY_RATIO:
+            self.remove(uri)
+            return
+
+        path = self.get_path(uri)
+        # Write to a temporary file and move it into place, so readers never see a partial file
+        fd, temp_path = tempfile.mkstemp(dir=self.folder, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(f"{etag}\t{json.dumps(metadata or {})}\n".encode('utf-8'))
+                f.write(content)
+            old_size = self._get_size(path)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Error caching {uri} on disk: {e}")
+            self._discard(temp_path)
+            return
+
+        with self.lock:
+            self.total_bytes += self._get_size(path) - old_size
+            full = self.total_bytes > self.max_bytes
+        if full:
+            self.evict()
+
+    def remove(self, uri):
+        """
+        Remove an object from the cache
+
+        Args:
+            uri (str): S3 URI of the object
+        """
+        path = self.get_path(uri)
+        size = self._get_size(path)
+        if not self._discard(path):
+            return
+        with self.lock:
+            self.total_bytes -= size
+
+    def evict(self):
+        """
+        Remove the least recently used files until the cache is within its size limit
+
+        Returns:
+            int: Number of files removed
+        """
+        with self.lock:
+            # Other processes may have added files, so size the folder again
+            entries = sorted(self._scan())
+            total_bytes = sum(size for _, _, size in entries)
+            target = self.max_bytes * EVICT_TARGET_RATIO
+
+            removed = 0
+            for _, path, size in entries:
+                if total_bytes <= target:
+                    break
+                if not self._discard(path):
+                    continue
+                total_bytes -= size
+                removed += 1
+
+            self.total_bytes = total_bytes
+
+        if removed:
+            print(f"Evicted {removed} files from the S3 disk cache")
+        return removed
+
+    def _scan(self):
+        # (last used, path, size) of every cache file
+        entries = []
+        for entry in os.scandir(self.folder):
+            if entry.name.startswith(".tmp-"):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, entry.path, stat.st_size))
+        return entries
+
+    def _touch(self, path):
+        # The modification time records the last use, for LRU eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _get_size(self, path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    def _discard(self, path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+def _parse_header(line):
+    # The first line of a cache file holds the ETag and the metadata, separated by a tab.
+    # Files without metadata were written by an older version and are treated as missing.
+    etag, separator, metadata = line.rstrip(b"\n").decode('utf-8', 'replace').partition("\t")
+    if not separator:
+        return None
+    try:
+        return etag, json.loads(metadata)
+    except ValueError:
+        return None
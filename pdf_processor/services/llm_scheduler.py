@@ -0,0 +1,292 @@
+import time
+import random
+import asyncio
+import logging
+import weakref
+import threading
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+import aiohttp
+import requests
+
+logger = logging.getLogger()
+
+# Failures without an HTTP status that are worth retrying
+RETRYABLE_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+    aiohttp.ClientConnectionError,
+    aiohttp.ClientPayloadError,
+    asyncio.TimeoutError,
+)
+
+class TokenBucket:
+    """
+    A thread-safe token bucket that refills at a fixed rate per minute.
+    Holds at most capacity tokens (one minute's worth by default), which is
+    the largest burst it allows.
+    """
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        """
+        Take tokens from the bucket, waiting until enough have refilled
+
+        Args:
+            amount (float): Number of tokens to take (capped at the bucket capacity)
+
+        Returns:
+            float: Seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            wait = self.try_acquire(amount)
+            if not wait:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    async def acquire_async(self, amount=1):
+        """
+        Take tokens from the bucket like acquire, sleeping on the event loop instead of blocking
+
+        Args:
+            amount (float): Number of tokens to take (capped at the bucket capacity)
+
+        Returns:
+            float: Seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            wait = self.try_acquire(amount)
+            if not wait:
+                return waited
+            await asyncio.sleep(wait)
+            waited += wait
+
+    def try_acquire(self, amount=1):
+        """
+        Take tokens from the bucket if enough are available, without waiting
+
+        Args:
+            amount (float): Number of tokens to take (capped at the bucket capacity)
+
+        Returns:
+            float: 0 if the tokens were taken, otherwise the seconds until enough have refilled
+        """
+        amount = min(amount, self.capacity)
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0.0
+            return (amount - self.tokens) / self.rate
+
+class RequestScheduler:
+    """
+    Runs API requests within requests-per-minute and tokens-per-minute limits
+    and a cap on concurrent requests, shared by every thread that uses it.
+    Rate-limited (429), server error (5xx) and connection failures are retried
+    with exponential backoff and jitter, honouring Retry-After; a 429 also
+    pauses all other requests until the provider's retry time.
+    """
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, max_concurrency=8,
+                 max_retries=5, backoff_base=1.0, backoff_max=60.0):
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_concurrency = max(1, max_concurrency)
+        self.slots = threading.BoundedSemaphore(self.max_concurrency)
+        # asyncio semaphores only work on the loop that uses them, so each loop gets its own
+        self.async_slots = weakref.WeakKeyDictionary()
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def slot(self):
+        """Hold one of the concurrent request slots"""
+        self.slots.acquire()
+        try:
+            yield
+        finally:
+            self.slots.release()
+
+    def wait_for_capacity(self, tokens=0):
+        """
+        Block until a request of the given size fits in the rate limits
+
+        Args:
+            tokens (int): Estimated tokens the request will use
+        """
+        with self.lock:
+            pause = self.paused_until - time.monotonic()
+        if pause > 0:
+            time.sleep(pause)
+
+        if self.request_bucket:
+            self.request_bucket.acquire(1)
+        if self.token_bucket and tokens:
+            self.token_bucket.acquire(tokens)
+
+    async def wait_for_capacity_async(self, tokens=0):
+        """
+        Wait like wait_for_capacity, sleeping on the event loop instead of blocking
+
+        Args:
+            tokens (int): Estimated tokens the request will use
+        """
+        with self.lock:
+            pause = self.paused_until - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+
+        if self.request_bucket:
+            await self.request_bucket.acquire_async(1)
+        if self.token_bucket and tokens:
+            await self.token_bucket.acquire_async(tokens)
+
+    def get_async_slots(self):
+        """
+        Get the concurrent request slots of the running event loop
+
+        Returns:
+            asyncio.Semaphore: Semaphore allowing max_concurrency requests on this loop
+        """
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            slots = self.async_slots.get(loop)
+            if slots is None:
+                slots = asyncio.Semaphore(self.max_concurrency)
+                self.async_slots[loop] = slots
+        return slots
+
+    def run(self, func, tokens=0, use_slot=True):
+        """
+        Call func within the rate limits, retrying transient failures
+
+        Args:
+            func (callable): Makes the request; called again on each retry
+            tokens (int): Estimated tokens the request will use
+            use_slot (bool): Take a concurrency slot (False if the caller already holds one)
+
+        Returns:
+            The return value of func
+
+        Raises:
+            Exception: The last error, once it is not retryable or retries are exhausted
+        """
+        attempt = 0
+        while True:
+            self.wait_for_capacity(tokens)
+            try:
+                if use_slot:
+                    with self.slot():
+                        return func()
+                return func()
+            except Exception as e:
+                error = e
+                delay = self.get_retry_delay(e, attempt)
+                if delay is None:
+                    raise
+
+            attempt += 1
+            logger.warning(f"Grok request failed, retry {attempt}/{self.max_retries} in {delay:.1f}s: {error}")
+            time.sleep(delay)
+
+    async def run_async(self, func, tokens=0):
+        """
+        Await func() within the rate limits, retrying transient failures
+
+        Waits sleep on the event loop, so no executor threads are held. Concurrency
+        is capped per event loop, separately from the slots used by threads.
+
+        Args:
+            func (callable): Returns a new awaitable for each attempt
+            tokens (int): Estimated tokens the request will use
+
+        Returns:
+            The result of the awaitable
+        """
+        slots = self.get_async_slots()
+        attempt = 0
+        while True:
+            await self.wait_for_capacity_async(tokens)
+            try:
+                async with slots:
+                    return await func()
+            except Exception as e:
+                error = e
+                delay = self.get_retry_delay(e, attempt)
+                if delay is None:
+                    raise
+
+            attempt += 1
+            logger.warning(f"Grok request failed, retry {attempt}/{self.max_retries} in {delay:.1f}s: {error}")
+            await asyncio.sleep(delay)
+
+    def get_retry_delay(self, error, attempt):
+        """
+        Decide whether a failed request should be retried, and after how long
+
+        Args:
+            error (Exception): The failure
+            attempt (int): Number of retries already made
+
+        Returns:
+            float: Seconds to wait before retrying, or None to give up
+        """
+        if attempt >= self.max_retries:
+            return None
+
+        status, headers = _get_error_status(error)
+        if status is None and not isinstance(error, RETRYABLE_ERRORS):
+            return None
+        if status is not None and status != 429 and status < 500:
+            return None
+
+        # Exponential backoff with full jitter
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+        retry_after = _parse_retry_after(headers.get('Retry-After')) if headers else None
+        if retry_after is not None:
+            delay = retry_after + random.uniform(0, self.backoff_base)
+
+        # Rate limited: hold back every other request too
+        if status == 429:
+            with self.lock:
+                self.paused_until = max(self.paused_until, time.monotonic() + delay)
+
+        return delay
+
+def _get_error_status(error):
+    # HTTP status and headers of a failed requests or aiohttp call
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        return error.response.status_code, error.response.headers
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status, error.headers or {}
+    return None, None
+
+def _parse_retry_after(value):
+    # Retry-After is either a number of seconds or an HTTP date
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,419 @@
+import os
+import time
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import Future, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+# MinerU imports
+from magic_pdf.data.dataset import PymuDocDataset
+from magic_pdf.model.doc_analyze_by_custom_model import doc_analyze, ModelSingleton
+from magic_pdf.libs.config_reader import get_layout_config, get_formula_config, get_table_recog_config
+
+from pdf_utils import get_page_count, extract_pages, merge_pdfs
+
+# Number of OCR worker processes. Lambda has no /dev/shm for multiprocessing queues,
+# so it defaults to 0, which runs inference in the calling process.
+OCR_WORKERS = int(os.environ.get(
+    'OCR_WORKERS',
+    0 if 'AWS_LAMBDA_FUNCTION_NAME' in os.environ else 2
+))
+
+# Torch threads per worker, defaults to an even split of the CPU cores
+OCR_WORKER_THREADS = int(os.environ.get(
+    'OCR_WORKER_THREADS',
+    max(1, (os.cpu_count() or 1) // max(1, OCR_WORKERS))
+))
+
+# Model sets to load when a worker starts ('ocr' and/or 'txt')
+OCR_WARM_MODES = [
+    mode.strip() for mode in os.environ.get('OCR_WARM_MODES', 'ocr,txt').split(',') if mode.strip()
+]
+
+# Split documents longer than OCR_SHARD_PAGES into page shards analyzed in parallel
+# (0 disables sharding), with at most OCR_SHARD_PARALLELISM shards of one document in flight
+OCR_SHARD_PAGES = int(os.environ.get('OCR_SHARD_PAGES', 32))
+OCR_SHARD_PARALLELISM = int(os.environ.get('OCR_SHARD_PARALLELISM', OCR_WORKERS))
+
+# Documents of up to OCR_BATCH_MAX_DOC_PAGES pages are combined with other queued documents
+# into one inference call of up to OCR_BATCH_PAGES pages, waiting at most OCR_BATCH_WAIT_MS
+# for more documents to arrive (OCR_BATCH_PAGES=0 disables batching)
+OCR_BATCH_PAGES = int(os.environ.get('OCR_BATCH_PAGES', 16))
+OCR_BATCH_WAIT_MS = int(os.environ.get('OCR_BATCH_WAIT_MS', 50))
+OCR_BATCH_MAX_DOC_PAGES = int(os.environ.get('OCR_BATCH_MAX_DOC_PAGES', 5))
+
+def _get_model_options():
+    """
+    Read the layout/MFD/MFR/table model settings from magic-pdf.json
+
+    The same options are passed when loading and when running the models, so
+    doc_analyze reuses the models loaded at worker startup.
+
+    Returns:
+        dict: Keyword arguments for doc_analyze
+    """
+    return {
+        'layout_model': get_layout_config().get('model'),
+        'formula_enable': get_formula_config().get('enable', True),
+        'table_enable': get_table_recog_config().get('enable', False),
+    }
+
+def _load_models():
+    """
+    Load the MinerU models once for this process
+    """
+    options = _get_model_options()
+    model_manager = ModelSingleton()
+
+    for mode in OCR_WARM_MODES:
+        print(f"Loading MinerU models for {mode} mode in process {os.getpid()}")
+        model_manager.get_model(mode == 'ocr', False, **options)
+
+def _init_worker(num_threads):
+    """
+    Initialize an OCR worker process
+    """
+    try:
+        import torch
+        torch.set_num_threads(num_threads)
+    except ImportError:
+        pass
+
+    _load_models()
+
+def _ping():
+    """
+    No-op task used to start the worker processes
+    """
+    return os.getpid()
+
+@contextmanager
+def open_dataset(pdf_bytes):
+    """
+    Open a PDF as a MinerU dataset whose PyMuPDF document is closed on exit
+
+    PyMuPDF reads the PDF from the given buffer without holding on to it, so a
+    dataset over a buffer from open_buffer must not outlive the buffer; closing
+    the document here makes any later use raise instead of reading freed memory.
+
+    Args:
+        pdf_bytes (bytes-like): PDF content
+
+    Yields:
+        PymuDocDataset: Dataset of the PDF
+    """
+    ds = PymuDocDataset(pdf_bytes)
+    try:
+        yield ds
+    finally:
+        ds._raw_fitz.close()
+
+def analyze_pages(pdf_bytes, ocr, start_page_id=0, end_page_id=None):
+    """
+    Run MinerU model inference on a PDF
+
+    Args:
+        pdf_bytes (bytes): PDF content
+        ocr (bool): Run OCR on the page images instead of using the text layer
+        start_page_id (int): First page to analyze
+        end_page_id (int, optional): Last page to analyze (inclusive). If None, analyzes to the end.
+
+    Returns:
+        list: Per-page model output, as returned by InferenceResult.get_infer_res()
+    """
+    with open_dataset(pdf_bytes) as ds:
+        infer_result = ds.apply(
+            doc_analyze,
+            ocr=ocr,
+            start_page_id=start_page_id,
+            end_page_id=end_page_id,
+            **_get_model_options()
+        )
+        return infer_result.get_infer_res()
+
+class MicroBatcher:
+    """
+    Collects small documents from concurrent jobs and runs them through the
+    OCR engine as one combined PDF, then splits the model output back per document.
+    Documents are batched separately for OCR and text mode.
+    """
+    def __init__(self, engine, max_pages=OCR_BATCH_PAGES, wait_ms=OCR_BATCH_WAIT_MS):
+        self.engine = engine
+        self.max_pages = max_pages
+        self.wait = wait_ms / 1000
+        self.pending = {True: [], False: []}
+        self.last_mode = False
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def submit(self, pdf_bytes, ocr, page_count):
+        """
+        Queue a document for the next batch
+
+        Args:
+            pdf_bytes (bytes): PDF content
+            ocr (bool): Run OCR on the page images instead of using the text layer
+            page_count (int): Number of pages in the PDF
+
+        Returns:
+            Future: Resolves to the document's per-page model output
+        """
+        future = Future()
+        with self.condition:
+            self.pending[ocr].append((pdf_bytes, page_count, future, time.monotonic()))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+            self.condition.notify()
+        return future
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not (self.pending[True] or self.pending[False]):
+                    self.condition.wait()
+
+                # Wait until a batch is full or its oldest document has waited long enough
+                while True:
+                    now = time.monotonic()
+                    ready = [
+                        mode for mode, requests in self.pending.items()
+                        if requests and (sum(r[1] for r in requests) >= self.max_pages
+                                         or requests[0][3] + self.wait <= now)
+                    ]
+                    if ready:
+                        break
+                    oldest = min(requests[0][3] for requests in self.pending.values() if requests)
+                    self.condition.wait(oldest + self.wait - now)
+
+                # Alternate when both modes are ready, so a busy mode can't starve the other one
+                ocr = ready[0] if len(ready) == 1 else not self.last_mode
+                self.last_mode = ocr
+                requests = self.pending[ocr]
+
+                # Take documents in arrival order up to the batch size
+                batch = [requests.pop(0)]
+                batch_pages = batch[0][1]
+                while requests and batch_pages + requests[0][1] <= self.max_pages:
+                    batch_pages += requests[0][1]
+                    batch.append(requests.pop(0))
+
+            self._dispatch(batch, ocr)
+
+    def _dispatch(self, batch, ocr):
+        try:
+            if len(batch) == 1:
+                pdf_bytes = batch[0][0]
+            else:
+                pdf_bytes = merge_pdfs([request[0] for request in batch])
+
+            if self.engine.workers <= 0:
+                self._resolve(batch, self.engine.analyze(pdf_bytes, ocr))
+            else:
+                future = self.engine.submit(pdf_bytes, ocr)
+                future.add_done_callback(lambda done: self._complete(batch, done))
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                self.engine._reset()
+            for request in batch:
+                request[2].set_exception(e)
+
+    def _complete(self, batch, future):
+        try:
+            self._resolve(batch, future.result())
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                self.engine._reset()
+            for request in batch:
+                if not request[2].done():
+                    request[2].set_exception(e)
+
+    def _resolve(self, batch, model_list):
+        # Split the combined output back per document, renumbering pages from 0
+        offset = 0
+        for pdf_bytes, page_count, future, queued_at in batch:
+            pages = model_list[offset:offset + page_count]
+            for page_dict in pages:
+                page_dict['page_info']['page_no'] -= offset
+            future.set_result(pages)
+            offset += page_count
+
+class OcrEngine:
+    """
+    A pool of OCR worker processes that load the MinerU models once at startup
+    and then serve many inference jobs sent to them over the pool's IPC queue.
+    With 0 workers, inference runs in the calling process, one job at a time.
+    Small documents go through a MicroBatcher so they share inference calls.
+    """
+    def __init__(self, workers=OCR_WORKERS, threads_per_worker=OCR_WORKER_THREADS):
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        self.executor = None
+        self.lock = threading.Lock()
+
+        # Bound in-process inference so concurrent requests do not pile up
+        self.local_slots = threading.Semaphore(1)
+
+        # Small documents from concurrent jobs are combined into shared inference calls
+        self.batcher = MicroBatcher(self) if OCR_BATCH_PAGES > 0 else None
+
+    def start(self):
+        """
+        Start the worker processes and load their models
+        """
+        if self.workers <= 0:
+            return
+
+        executor = self._get_executor()
+        for future in [executor.submit(_ping) for _ in range(self.workers)]:
+            future.result()
+
+    def _get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                print(f"Starting OCR engine with {self.workers} worker processes")
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(self.threads_per_worker,)
+                )
+            return self.executor
+
+    def submit(self, pdf_bytes, ocr, start_page_id=0, end_page_id=None):
+        """
+        Queue a PDF page range for inference on the worker pool
+
+        Args:
+            pdf_bytes (bytes): PDF content
+            ocr (bool): Run OCR on the page images instead of using the text layer
+            start_page_id (int): First page to analyze
+            end_page_id (int, optional): Last page to analyze (inclusive)
+
+        Returns:
+            Future: Resolves to the per-page model output
+        """
+        # Worker processes get a copy; buffers such as memory-mapped files can't be pickled
+        if not isinstance(pdf_bytes, bytes):
+            pdf_bytes = bytes(pdf_bytes)
+        return self._get_executor().submit(
+            analyze_pages, pdf_bytes, ocr, start_page_id, end_page_id
+        )
+
+    def analyze(self, pdf_bytes, ocr, start_page_id=0, end_page_id=None):
+        """
+        Run inference on a PDF page range and wait for the result
+
+        Args:
+            pdf_bytes (bytes): PDF content
+            ocr (bool): Run OCR on the page images instead of using the text layer
+            start_page_id (int): First page to analyze
+            end_page_id (int, optional): Last page to analyze (inclusive)
+
+        Returns:
+            list: Per-page model output
+        """
+        if self.workers <= 0:
+            with self.local_slots:
+                return analyze_pages(pdf_bytes, ocr, start_page_id, end_page_id)
+
+        try:
+            return self.submit(pdf_bytes, ocr, start_page_id, end_page_id).result()
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory), so start a fresh pool for the next job
+            self._reset()
+            raise
+
+    def analyze_document(self, pdf_bytes, ocr, shard_pages=OCR_SHARD_PAGES, parallelism=OCR_SHARD_PARALLELISM):
+        """
+        Run inference on a whole PDF, splitting long documents into page shards
+        that are analyzed in parallel on the worker pool
+
+        Args:
+            pdf_bytes (bytes): PDF content
+            ocr (bool): Run OCR on the page images instead of using the text layer
+            shard_pages (int): Pages per shard, 0 to analyze the document in one pass
+            parallelism (int): Maximum number of shards of this document in flight
+
+        Returns:
+            list: Per-page model output for every page, in page order
+        """
+        page_count = get_page_count(pdf_bytes)
+
+        # Small documents wait briefly to share an inference batch with other jobs
+        if self.batcher and page_count <= min(OCR_BATCH_MAX_DOC_PAGES, self.batcher.max_pages):
+            return self.batcher.submit(pdf_bytes, ocr, page_count).result()
+
+        # Sharding only helps when several workers can run at once
+        if self.workers <= 1 or not shard_pages or page_count <= shard_pages:
+            return self.analyze(pdf_bytes, ocr)
+
+        shards = [
+            (start, min(start + shard_pages, page_count) - 1)
+            for start in range(0, page_count, shard_pages)
+        ]
+        window = max(1, parallelism or self.workers)
+        print(f"Analyzing {page_count} pages in {len(shards)} shards of {shard_pages} pages")
+
+        results = [None] * len(shards)
+        pending = {}
+        next_shard = 0
+
+        try:
+            while next_shard < len(shards) or pending:
+                # Keep up to `window` shards in flight
+                while next_shard < len(shards) and len(pending) < window:
+                    start, end = shards[next_shard]
+                    shard_bytes = extract_pages(pdf_bytes, range(start, end + 1))
+                    pending[self.submit(shard_bytes, ocr)] = next_shard
+                    next_shard += 1
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[pending.pop(future)] = future.result()
+        except BrokenProcessPool:
+            self._reset()
+            raise
+        finally:
+            for future in pending:
+                future.cancel()
+
+        # Merge the shards back in page order, renumbering pages to the full document
+        model_list = []
+        for (start, end), shard_result in zip(shards, results):
+            for page_dict in shard_result:
+                page_dict['page_info']['page_no'] += start
+                model_list.append(page_dict)
+        return model_list
+
+    def _reset(self):
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def shutdown(self):
+        """
+        Stop the worker processes
+        """
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_ocr_engine():
+    """
+    Get the shared OCR engine for this process
+
+    Returns:
+        OcrEngine: The shared engine
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = OcrEngine()
+        return _engine
@@ -1,191 +1,587 @@
 import os
 import json
+import hashlib
 import tempfile
-from storage_service import download_to_temp, write_file
+from concurrent.futures import ThreadPoolExecutor
+from storage_service import read_file, open_buffer, write_file, delete_file, list_files, join_path
+from cache_service import StorageCache
+from ocr_engine import get_ocr_engine, open_dataset
+from pdf_utils import classify_pages, extract_pages, get_page_count
+from text_extractor import extract_page_texts
+from boilerplate import remove_boilerplate
 
 # MinerU imports
-from magic_pdf.data.data_reader_writer import FileBasedDataWriter, FileBasedDataReader
-from magic_pdf.data.dataset import PymuDocDataset
-from magic_pdf.model.doc_analyze_by_custom_model import doc_analyze
+from magic_pdf.data.data_reader_writer import FileBasedDataWriter
+from magic_pdf.data.data_reader_writer.base import DataWriter
+from magic_pdf.operators.models import InferenceResult
+from magic_pdf.operators.pipes import PipeResult
 from magic_pdf.config.enums import SupportedPdfParseMethod
+from magic_pdf.config.make_content_config import MakeMode, DropMode
+from magic_pdf.dict2md.ocr_mkcontent import union_make
+from magic_pdf.libs.version import __version__ as MINERU_VERSION
 
-def extract_text_from_pdf(pdf_path):
+# OCR result cache settings
+OCR_CACHE_ENABLED = os.environ.get('OCR_CACHE_ENABLED', 'true').lower() == 'true'
+OCR_CACHE_FOLDER = os.environ.get(
+    'OCR_CACHE_FOLDER',
+    'ocr_cache' if 'AWS_LAMBDA_FUNCTION_NAME' in os.environ
+    else os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "uploads/ocr_cache")
+)
+OCR_CACHE_MAX_BYTES = int(os.environ.get('OCR_CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024))  # 2GB
+OCR_CACHE_MAX_AGE = int(os.environ.get('OCR_CACHE_MAX_AGE', 30 * 24 * 60 * 60))  # 30 days
+
+# Pages per OCR window. Windows are checkpointed as they finish, so long documents report
+# progress and partial text as they go and a retry after a timeout resumes from the last window.
+# Each window runs the full pipeline on its own, so paragraphs and tables that cross a window
+# boundary are split and OCR_SHARD_PAGES sharding only applies within a window. 0 processes
+# the whole document in one pass, with no partial results or checkpoints until it finishes.
+OCR_STREAM_PAGES = int(os.environ.get('OCR_STREAM_PAGES', 4))
+
+# Keep the PDF and extracted images in memory instead of temporary files
+OCR_IN_MEMORY = os.environ.get('OCR_IN_MEMORY', 'true').lower() == 'true'
+
+# Save each finished page under the output prefix so retried jobs resume where they stopped
+OCR_CHECKPOINTS_ENABLED = os.environ.get('OCR_CHECKPOINTS_ENABLED', 'true').lower() == 'true'
+
+# Relative image folder used in the markdown
+IMAGE_DIR = "images"
+
+# Pages with fewer text-layer characters than this are sent to OCR
+OCR_TEXT_MIN_CHARS = int(os.environ.get('OCR_TEXT_MIN_CHARS', 50))
+
+# Bump OCR_MODEL_VERSION when the models in magic-pdf.json change so stale results are not reused
+OCR_MODEL_VERSION = os.environ.get('OCR_MODEL_VERSION', MINERU_VERSION)
+
+ocr_cache = StorageCache(OCR_CACHE_FOLDER, max_bytes=OCR_CACHE_MAX_BYTES, max_age=OCR_CACHE_MAX_AGE)
+
+def get_cache_key(pdf_bytes, parse_method, model_version=OCR_MODEL_VERSION):
+    """
+    Build the OCR cache key for a PDF
+    
+    Args:
+        pdf_bytes (bytes): PDF content
+        parse_method (str): Requested parse method ('auto', 'ocr' or 'txt')
+        model_version (str): Version of the OCR models
+        
+    Returns:
+        str: Cache key made of the SHA-256 of the PDF, the parse method and the model version
+    """
+    digest = hashlib.sha256(pdf_bytes).hexdigest()
+    return f"{digest}-{parse_method}-{model_version}"
+
+def extract_text_from_pdf(pdf_path, parse_method='auto', on_page=None, output_prefix=None):
     """
     Extract text from PDF using MinerU OCR technology and save JSON results to output/{document_id}/ directory
     
+    Results are cached by PDF content, so re-uploads of the same document skip OCR.
+    Headers, footers, page numbers and watermarks repeated across pages are
+    removed from the returned text.
+    
     Args:
         pdf_path (str): Path to the PDF file (can be S3 URI or local path)
+        parse_method (str): 'auto' to classify each page, 'ocr'/'txt' to force a mode,
+            or 'fast' to only read the text layer
+        on_page (callable, optional): Called with each page dict yielded by iter_pdf_pages
+        output_prefix (str, optional): Folder or S3 prefix for outputs and page checkpoints
         
     Returns:
         str: Extracted text from the PDF
     """
+    pages = []
+    for page in iter_pdf_pages(pdf_path, parse_method, output_prefix):
+        pages.append(page)
+        if on_page:
+            on_page(page)
+    
+    # Repeated blocks are only known once every page is done
+    try:
+        texts = remove_boilerplate(pages, IMAGE_DIR)
+    except Exception as e:
+        print(f"Error removing boilerplate: {e}")
+        texts = [page["markdown"] for page in pages]
+    
+    return "\n\n".join(text for text in texts if text)
+
+def iter_pdf_pages(pdf_path, parse_method='auto', output_prefix=None):
+    """
+    Extract text from PDF one page at a time
+    
+    Pages are processed in windows of OCR_STREAM_PAGES pages, several windows at once,
+    and yielded in page order as soon as they are ready. Each finished page is
+    checkpointed under output_prefix, so a retried job only runs OCR on the pages
+    that are still missing.
+    
+    Args:
+        pdf_path (str): Path to the PDF file (can be S3 URI or local path)
+        parse_method (str): 'auto' to classify each page, 'ocr'/'txt' to force a mode,
+            or 'fast' to only read the text layer
+        output_prefix (str, optional): Folder or S3 prefix for outputs and page checkpoints.
+            If None, S3 inputs use output/{document_id} in the same bucket and local inputs save nothing.
+        
+    Yields:
+        dict: 'page_idx' (0-based), 'pages_total' and 'markdown' of each page, and
+            'page_info' (the page's middle_json entry) for pages processed by MinerU
+    """
     print(f"Processing PDF: {pdf_path}")
     
-    # If PDF path is S3 URI, download to temp file
-    local_pdf_path = download_to_temp(pdf_path)
+    pdf_buffer = None
+    pdf_bytes = None
+    pages_done = 0
+    pages_total = 0
     
     try:
-        # Get the PDF filename without extension
-        pdf_filename = os.path.basename(local_pdf_path)
+        # Name outputs after the original file rather than the temporary download
+        pdf_filename = os.path.basename(pdf_path)
         document_id = os.path.splitext(pdf_filename)[0]
         
-        # Create temporary directories for processing
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # Set up output directories with document_id
-            output_base_dir = os.path.join(temp_dir, document_id)
-            local_image_dir = os.path.join(output_base_dir, "images")
-            local_md_dir = os.path.join(output_base_dir, "md")
-            image_dir = "images"  # Relative path for markdown
-            
-            # Create directories
-            os.makedirs(output_base_dir, exist_ok=True)
-            os.makedirs(local_image_dir, exist_ok=True)
-            os.makedirs(local_md_dir, exist_ok=True)
-            
-            # Create writers for saving output
-            image_writer = FileBasedDataWriter(local_image_dir)
-            md_writer = FileBasedDataWriter(local_md_dir)
-            
-            # Read PDF content
-            reader = FileBasedDataReader("")
-            pdf_bytes = reader.read(local_pdf_path)  # read the pdf content
-            
-            # Create Dataset Instance
-            ds = PymuDocDataset(pdf_bytes)
-            
-            # Process based on PDF type
-            if ds.classify() == SupportedPdfParseMethod.OCR:
-                print("Using OCR mode for this PDF")
-                infer_result = ds.apply(doc_analyze, ocr=True)
-                pipe_result = infer_result.pipe_ocr_mode(image_writer)
-            else:
-                print("Using text extraction mode for this PDF")
-                infer_result = ds.apply(doc_analyze, ocr=False)
-                pipe_result = infer_result.pipe_txt_mode(image_writer)
-            
-            # Generate and save output files
-            model_pdf_path = os.path.join(local_md_dir, f"{document_id}_model.pdf")
-            layout_pdf_path = os.path.join(local_md_dir, f"{document_id}_layout.pdf")
-            spans_pdf_path = os.path.join(local_md_dir, f"{document_id}_spans.pdf")
-            infer_result.draw_model(model_pdf_path)
-            pipe_result.draw_layout(layout_pdf_path)
-            pipe_result.draw_span(spans_pdf_path)
-            
-            # Get markdown content
-            md_content = pipe_result.get_markdown(image_dir)
-            
-            # Dump markdown to file
-            md_file_path = f"{document_id}.md"
-            pipe_result.dump_md(md_writer, md_file_path, image_dir)
-            
-            # Get content list and middle json
-            content_list = pipe_result.get_content_list(image_dir)
-            middle_json = pipe_result.get_middle_json()
-            
-            # Save processed files in temporary directory
-            raw_json_path = os.path.join(output_base_dir, f"{document_id}_content.json")
-            with open(raw_json_path, "w", encoding="utf-8") as f:
-                json.dump(content_list, f, ensure_ascii=False, indent=2)
+        if output_prefix is None and pdf_path.startswith('s3://'):
+            bucket = pdf_path[5:].split('/', 1)[0]
+            output_prefix = f"s3://{bucket}/output/{document_id}"
+        
+        # Map the PDF (or download it from S3 into one buffer) rather than copying it into bytes
+        pdf_buffer = open_buffer(pdf_path)
+        pdf_bytes = pdf_buffer.view
+        pages_total = get_page_count(pdf_bytes)
+        
+        # The fast mode only reads the text layer, without loading any models
+        if parse_method == 'fast':
+            for page in _iter_text_layer_pages(pdf_path, pdf_bytes, output_prefix=output_prefix):
+                yield page
+            return
+        
+        # Serve repeated documents from the cache
+        cache_key = get_cache_key(pdf_bytes, parse_method)
+        result = ocr_cache.get(cache_key) if OCR_CACHE_ENABLED else None
+        checkpoint_folder = None
+        
+        if result is not None:
+            print(f"OCR cache hit for {pdf_path}")
+            for page in _split_pages(result):
+                yield _page_progress(page, pages_total)
+                pages_done += 1
+        else:
+            # Pick up the pages a previous attempt already finished
+            pages = {}
+            if output_prefix and OCR_CHECKPOINTS_ENABLED:
+                checkpoint_folder = join_path(output_prefix, "pages")
+                pages = _load_checkpoints(checkpoint_folder, cache_key)
+                if pages:
+                    print(f"Resuming OCR with {len(pages)} of {pages_total} pages already done")
             
-            middle_raw_path = os.path.join(output_base_dir, f"{document_id}_middle.json")
-            if not isinstance(middle_json, str):
-                with open(middle_raw_path, "w", encoding="utf-8") as f:
-                    json.dump(middle_json, f, ensure_ascii=False, indent=2)
-            else:
-                with open(middle_raw_path, "w", encoding="utf-8") as f:
-                    f.write(middle_json)
+            # Group the remaining pages into windows of consecutive pages
+            window_pages = OCR_STREAM_PAGES or pages_total
+            windows = []
+            for page_idx in range(pages_total):
+                if page_idx in pages:
+                    continue
+                if windows and windows[-1][1] == page_idx and page_idx - windows[-1][0] < window_pages:
+                    windows[-1][1] = page_idx + 1
+                else:
+                    windows.append([page_idx, page_idx + 1])
             
-            # Read the full extracted text from the markdown file
-            md_file_path = os.path.join(local_md_dir, md_file_path)
-            with open(md_file_path, "r", encoding="utf-8") as f:
-                extracted_text = f.read()
+            def run_window(window):
+                start, end = window
+                if start == 0 and end == pages_total:
+                    window_bytes = pdf_bytes
+                else:
+                    window_bytes = extract_pages(pdf_bytes, range(start, end))
+                window_pages = _split_pages(_run_mineru(window_bytes, document_id, parse_method), start)
+                
+                # Checkpoint as soon as the window is done, even if earlier windows are still running
+                if checkpoint_folder:
+                    for page in window_pages:
+                        _save_checkpoint(checkpoint_folder, cache_key, page)
+                return window_pages
             
-            # If running in Lambda, store important files to S3
-            if 'AWS_LAMBDA_FUNCTION_NAME' in os.environ:
-                # Determine S3 paths based on input path
-                if pdf_path.startswith('s3://'):
-                    # Extract bucket and document_id from the pdf_path
-                    parts = pdf_path[5:].split('/', 1)
-                    bucket = parts[0]
-                    
-                    # Determine output prefix based on document_id
-                    output_prefix = f"output/{document_id}"
-                    
-                    # Upload important files to S3
-                    s3_md_path = f"s3://{bucket}/{output_prefix}/{document_id}.md"
-                    s3_content_path = f"s3://{bucket}/{output_prefix}/{document_id}_content.json"
-                    
-                    # Use storage_service to write files
-                    write_file(s3_md_path, extracted_text, "text/markdown")
+            # Run windows concurrently on the OCR engine, collecting them in page order
+            executor = ThreadPoolExecutor(max_workers=max(1, get_ocr_engine().workers))
+            try:
+                window_results = executor.map(run_window, windows)
+                
+                for page_idx in range(pages_total):
+                    if page_idx not in pages:
+                        # The next window starts at this page
+                        for page in next(window_results):
+                            pages[page["page_idx"]] = page
                     
-                    # Read and upload content JSON
-                    with open(raw_json_path, "r", encoding="utf-8") as f:
-                        content_json = f.read()
-                    write_file(s3_content_path, content_json, "application/json")
+                    yield _page_progress(pages[page_idx], pages_total)
+                    pages_done += 1
+            finally:
+                # If the caller stops early, don't start the windows that are still queued
+                executor.shutdown(wait=True, cancel_futures=True)
             
-            return extracted_text
+            result = _merge_pages([pages[page_idx] for page_idx in range(pages_total)])
+            if OCR_CACHE_ENABLED:
+                try:
+                    ocr_cache.put(cache_key, result)
+                except Exception as e:
+                    print(f"Error caching OCR result: {e}")
+        
+        if output_prefix:
+            _save_outputs(output_prefix, document_id, result)
+        
+        # The full result is saved, so the page checkpoints are no longer needed
+        if checkpoint_folder:
+            _clear_checkpoints(checkpoint_folder)
     except Exception as e:
         print(f"Error extracting text with MinerU: {e}")
-        # Fall back to basic text extraction if MinerU fails
-        return _fallback_text_extraction(local_pdf_path)
+        # Fall back to the text layer for the pages MinerU did not finish
+        for page in _iter_text_layer_pages(pdf_path, pdf_bytes, pages_done, output_prefix):
+            yield page
     finally:
-        # Delete temporary file if we created one
-        if local_pdf_path != pdf_path and os.path.exists(local_pdf_path):
-            os.unlink(local_pdf_path)
+        if pdf_buffer is not None:
+            pdf_buffer.close()
+
+def _page_progress(page, pages_total):
+    """
+    Build the page dict yielded by iter_pdf_pages
+    """
+    return {
+        "page_idx": page["page_idx"],
+        "pages_total": pages_total,
+        "markdown": page["markdown"],
+        "page_info": page["page_info"],
+    }
+
+def _split_pages(result, start_page=0):
+    """
+    Split an OCR result into per-page results
+    
+    Args:
+        result (dict): OCR result returned by _run_mineru
+        start_page (int): Page number of the result's first page in the full document
+        
+    Returns:
+        list: One dict per page with 'page_idx', 'markdown', 'content_list',
+            'page_info' (the page's middle_json entry), 'model_page' (the page's
+            model output) and 'middle_header'
+    """
+    middle_json = _load_json(result["middle_json"])
+    middle_header = {key: value for key, value in middle_json.items() if key != "pdf_info"}
+    
+    content_by_page = {}
+    for item in result["content_list"]:
+        content_by_page.setdefault(item.get("page_idx", 0), []).append(item)
+    
+    # Results cached before model output was kept have no model_json
+    model_by_page = {
+        page_dict["page_info"]["page_no"]: page_dict for page_dict in result.get("model_json", [])
+    }
+    
+    pages = []
+    for page_info in middle_json["pdf_info"]:
+        local_idx = page_info["page_idx"]
+        page_idx = start_page + local_idx
+        
+        content_list = content_by_page.get(local_idx, [])
+        for item in content_list:
+            item["page_idx"] = page_idx
+        
+        model_page = model_by_page.get(local_idx)
+        if model_page is not None:
+            model_page["page_info"]["page_no"] = page_idx
+        
+        pages.append({
+            "page_idx": page_idx,
+            "markdown": union_make([page_info], MakeMode.MM_MD, DropMode.NONE, IMAGE_DIR),
+            "content_list": content_list,
+            "page_info": dict(page_info, page_idx=page_idx),
+            "model_page": model_page,
+            "middle_header": middle_header,
+        })
+    
+    return pages
+
+def _merge_pages(pages):
+    """
+    Merge per-page results into one document result
+    
+    Args:
+        pages (list): Per-page results from _split_pages, in page order
+        
+    Returns:
+        dict: 'markdown', 'content_list', 'middle_json' and 'model_json' of the full document
+    """
+    middle_json = dict(pages[0]["middle_header"]) if pages else {}
+    parse_types = {page["middle_header"].get("_parse_type") for page in pages}
+    if len(parse_types) > 1:
+        middle_json["_parse_type"] = "mixed"
+    middle_json["pdf_info"] = [page["page_info"] for page in pages]
+    
+    return {
+        "markdown": "\n\n".join(page["markdown"] for page in pages if page["markdown"]),
+        "content_list": [item for page in pages for item in page["content_list"]],
+        "middle_json": middle_json,
+        "model_json": [page["model_page"] for page in pages if page.get("model_page") is not None],
+    }
 
-def _fallback_text_extraction(pdf_path):
+def _load_checkpoints(checkpoint_folder, cache_key):
     """
-    Fallback method for text extraction if MinerU fails
+    Load the page checkpoints of a previous attempt
     
     Args:
-        pdf_path (str): Path to the PDF file
+        checkpoint_folder (str): Folder or S3 prefix of the checkpoints
+        cache_key (str): Cache key of the PDF, so checkpoints of a different PDF are ignored
         
     Returns:
-        str: Extracted text from the PDF using basic methods
+        dict: Per-page results keyed by page number
+    """
+    pages = {}
+    for entry in list_files(checkpoint_folder):
+        try:
+            page = json.loads(read_file(entry['path']).decode('utf-8'))
+        except Exception as e:
+            print(f"Error reading OCR checkpoint {entry['path']}: {e}")
+            continue
+        if page.get("key") == cache_key:
+            pages[page["page_idx"]] = page
+    return pages
+
+def _save_checkpoint(checkpoint_folder, cache_key, page):
+    """
+    Save the result of one page
+    
+    Args:
+        checkpoint_folder (str): Folder or S3 prefix of the checkpoints
+        cache_key (str): Cache key of the PDF
+        page (dict): Per-page result from _split_pages
+    """
+    path = join_path(checkpoint_folder, f"{page['page_idx']:05d}.json")
+    try:
+        write_file(path, json.dumps(dict(page, key=cache_key), ensure_ascii=False), "application/json")
+    except Exception as e:
+        print(f"Error saving OCR checkpoint {path}: {e}")
+
+def _clear_checkpoints(checkpoint_folder):
+    """
+    Delete the page checkpoints of a finished document
+    """
+    for entry in list_files(checkpoint_folder):
+        delete_file(entry['path'])
+
+def _load_json(value):
+    """
+    Parse a JSON string, passing through values that are already parsed
+    """
+    return json.loads(value) if isinstance(value, str) else value
+
+def _run_mineru(pdf_bytes, document_id, parse_method='auto', shard_pages=None):
+    """
+    Run the MinerU pipeline on a PDF
+    
+    Args:
+        pdf_bytes (bytes): PDF content
+        document_id (str): Document ID used to name intermediate files
+        parse_method (str): 'auto' to classify the PDF, or 'ocr'/'txt' to force a mode
+        shard_pages (int, optional): Pages per parallel inference shard, 0 for a single pass.
+            If None, uses the engine default (OCR_SHARD_PAGES).
+        
+    Returns:
+        dict: 'markdown', 'content_list', 'middle_json' and 'model_json' of the document
+    """
+    if OCR_IN_MEMORY:
+        # Keep the extracted images in memory, so nothing touches the disk
+        return _run_pipeline(pdf_bytes, parse_method, InMemoryDataWriter(), shard_pages)
+    
+    # Create temporary directory for the extracted images
+    with tempfile.TemporaryDirectory() as temp_dir:
+        local_image_dir = os.path.join(temp_dir, document_id, IMAGE_DIR)
+        os.makedirs(local_image_dir, exist_ok=True)
+        return _run_pipeline(pdf_bytes, parse_method, FileBasedDataWriter(local_image_dir), shard_pages)
+
+def _run_pipeline(pdf_bytes, parse_method, image_writer, shard_pages=None):
+    """
+    Run model inference and the pipe stage on a PDF
+    
+    Args:
+        pdf_bytes (bytes): PDF content
+        parse_method (str): 'auto' to classify the PDF, or 'ocr'/'txt' to force a mode
+        image_writer (DataWriter): Writer for the extracted images
+        shard_pages (int, optional): Pages per parallel inference shard
+        
+    Returns:
+        dict: 'markdown', 'content_list', 'middle_json' and 'model_json' of the document
+    """
+    # Create Dataset Instance; its PyMuPDF document is closed before pdf_bytes may be released
+    with open_dataset(pdf_bytes) as ds:
+        # Model inference runs on the shared OCR engine, which keeps the models loaded
+        engine = get_ocr_engine()
+        shard_options = {} if shard_pages is None else {'shard_pages': shard_pages}
+        
+        # Classify each page, so scanned pages do not force born-digital pages through OCR
+        page_modes = classify_pages(pdf_bytes, OCR_TEXT_MIN_CHARS) if parse_method == 'auto' else []
+        
+        # When every page has the same mode, that mode is used for the whole PDF;
+        # MinerU's own classifier only decides when there are no page modes
+        if parse_method != 'auto':
+            mode = parse_method
+        elif page_modes:
+            mode = page_modes[0]
+        else:
+            mode = 'ocr' if ds.classify() == SupportedPdfParseMethod.OCR else 'txt'
+        
+        # Process based on PDF type
+        if len(set(page_modes)) > 1:
+            print(f"Using OCR mode for {page_modes.count('ocr')} of {len(page_modes)} pages "
+                  "and text extraction mode for the rest")
+            infer_result, pipe_result = _run_mixed_modes(pdf_bytes, ds, page_modes, image_writer, shard_options)
+        elif mode == 'ocr':
+            print("Using OCR mode for this PDF")
+            infer_result = InferenceResult(engine.analyze_document(pdf_bytes, ocr=True, **shard_options), ds)
+            pipe_result = infer_result.pipe_ocr_mode(image_writer)
+        else:
+            print("Using text extraction mode for this PDF")
+            infer_result = InferenceResult(engine.analyze_document(pdf_bytes, ocr=False, **shard_options), ds)
+            pipe_result = infer_result.pipe_txt_mode(image_writer)
+        
+        # Take the outputs straight from the pipe result; they are only serialised when saved.
+        # The model output and middle json are kept so diagnostics can be rendered on demand.
+        return {
+            "markdown": pipe_result.get_markdown(IMAGE_DIR),
+            "content_list": pipe_result.get_content_list(IMAGE_DIR),
+            "middle_json": _get_middle_json(pipe_result),
+            "model_json": infer_result.get_infer_res(),
+        }
+
+def _get_middle_json(pipe_result):
+    """
+    Get the middle json of a pipe result as a dict
+    
+    PipeResult.get_middle_json() returns an indented JSON string, so the
+    underlying dict is used when available to avoid a dump/parse round trip.
+    """
+    middle_json = getattr(pipe_result, '_pipe_res', None)
+    if middle_json is None:
+        middle_json = _load_json(pipe_result.get_middle_json())
+    return middle_json
+
+class InMemoryDataWriter(DataWriter):
+    """
+    MinerU data writer that keeps the written files in memory
+    """
+    def __init__(self):
+        self.files = {}
+
+    def write(self, path, data):
+        self.files[path] = data
+
+def _run_mixed_modes(pdf_bytes, ds, page_modes, image_writer, shard_options):
+    """
+    Run each group of pages in its own parse mode and stitch the results back in page order
+    
+    Args:
+        pdf_bytes (bytes): PDF content
+        ds (PymuDocDataset): Dataset of the full PDF
+        page_modes (list): 'txt' or 'ocr' for each page
+        image_writer (DataWriter): Writer for the extracted images
+        shard_options (dict): Sharding options for the OCR engine
+        
+    Returns:
+        tuple: InferenceResult and PipeResult covering every page of the PDF
+    """
+    engine = get_ocr_engine()
+    model_pages = []
+    pdf_info = []
+    middle_json = None
+    
+    for mode in ('txt', 'ocr'):
+        page_ids = [page_id for page_id, page_mode in enumerate(page_modes) if page_mode == mode]
+        
+        # Analyze the pages of this mode as their own document
+        sub_bytes = extract_pages(pdf_bytes, page_ids)
+        with open_dataset(sub_bytes) as sub_ds:
+            infer_result = InferenceResult(
+                engine.analyze_document(sub_bytes, ocr=(mode == 'ocr'), **shard_options), sub_ds
+            )
+            if mode == 'ocr':
+                pipe_result = infer_result.pipe_ocr_mode(image_writer)
+            else:
+                pipe_result = infer_result.pipe_txt_mode(image_writer)
+        
+        # Map the pages back to their page numbers in the full document
+        for page_dict in infer_result.get_infer_res():
+            page_dict['page_info']['page_no'] = page_ids[page_dict['page_info']['page_no']]
+            model_pages.append(page_dict)
+        
+        middle_json = _get_middle_json(pipe_result)
+        for page_info in middle_json['pdf_info']:
+            page_info['page_idx'] = page_ids[page_info['page_idx']]
+            pdf_info.append(page_info)
+    
+    model_pages.sort(key=lambda page_dict: page_dict['page_info']['page_no'])
+    pdf_info.sort(key=lambda page_info: page_info['page_idx'])
+    middle_json['pdf_info'] = pdf_info
+    middle_json['_parse_type'] = 'mixed'
+    
+    return InferenceResult(model_pages, ds), PipeResult(middle_json, ds)
+
+def _save_outputs(output_prefix, document_id, result):
+    """
+    Store the important OCR outputs under the document's output prefix
+    
+    Args:
+        output_prefix (str): Folder or S3 prefix for the outputs
+        document_id (str): Document ID used to name the output files
+        result (dict): OCR result of the full document
+    """
+    md_path = join_path(output_prefix, f"{document_id}.md")
+    content_path = join_path(output_prefix, f"{document_id}_content.json")
+    
+    # Use storage_service to write files
+    write_file(md_path, result["markdown"], "text/markdown")
+    
+    # Upload content JSON
+    content_json = json.dumps(result["content_list"], ensure_ascii=False)
+    write_file(content_path, content_json, "application/json")
+    
+    # Keep the compact intermediate data that diagnostics are rendered from
+    middle_path = join_path(output_prefix, f"{document_id}_middle.json")
+    write_file(middle_path, json.dumps(result["middle_json"], ensure_ascii=False), "application/json")
+    
+    if result.get("model_json"):
+        model_path = join_path(output_prefix, f"{document_id}_model.json")
+        write_file(model_path, json.dumps(result["model_json"], ensure_ascii=False), "application/json")
+
+def _iter_text_layer_pages(pdf_path, pdf_bytes=None, start_page=0, output_prefix=None):
+    """
+    Extract the text layer of each page with PyMuPDF, without any OCR
+    
+    Used by the 'fast' parse method and as the fallback when MinerU fails.
+    
+    Args:
+        pdf_path (str): Path to the PDF file (can be S3 URI or local path)
+        pdf_bytes (bytes, optional): PDF content, if already read
+        start_page (int): First page to extract, for pages MinerU did not finish
+        output_prefix (str, optional): Folder or S3 prefix to save the full text to
+        
+    Yields:
+        dict: 'page_idx', 'pages_total' and 'markdown' of each page
     """
     try:
-        import fitz  # PyMuPDF
-        print("Using fallback text extraction with PyMuPDF")
-        extracted_text = ""
+        print("Using text layer extraction with PyMuPDF")
+        if pdf_bytes is None:
+            pdf_bytes = read_file(pdf_path)
         
-        # Create fallback temporary directory
-        with tempfile.TemporaryDirectory() as fallback_dir:
+        texts = extract_page_texts(pdf_bytes, start_page)
+        pages_total = start_page + len(texts)
+        
+        # Store the text when it covers the whole document
+        if output_prefix and start_page == 0:
             document_id = os.path.splitext(os.path.basename(pdf_path))[0]
-            
-            # Open the PDF
-            doc = fitz.open(pdf_path)
-            
-            # Process each page
-            for page_num, page in enumerate(doc):
-                print(f"Processing page {page_num + 1}/{len(doc)}")
-                
-                # Extract text directly
-                text = page.get_text()
-                extracted_text += text + "\n\n"
-                
-                # Save individual page text
-                page_file = os.path.join(fallback_dir, f"page_{page_num+1}.txt")
-                with open(page_file, "w", encoding="utf-8") as f:
-                    f.write(text)
-            
-            # Close the document
-            doc.close()
-            
-            # Save full text to fallback directory
-            full_text_path = os.path.join(fallback_dir, f"{document_id}_full_text.txt")
-            with open(full_text_path, "w", encoding="utf-8") as f:
-                f.write(extracted_text)
-                
-            # If running in Lambda, store extracted text to S3
-            if 'AWS_LAMBDA_FUNCTION_NAME' in os.environ and pdf_path.startswith('s3://'):
-                parts = pdf_path[5:].split('/', 1)
-                bucket = parts[0]
-                output_prefix = f"output/{document_id}/fallback"
-                s3_text_path = f"s3://{bucket}/{output_prefix}/{document_id}_full_text.txt"
-                write_file(s3_text_path, extracted_text, "text/plain")
-            
-            print(f"Saved fallback extraction to temporary directory")
-            return extracted_text.strip()
+            text_path = join_path(output_prefix, f"{document_id}_full_text.txt")
+            write_file(text_path, "\n\n".join(text.strip() for text in texts), "text/plain")
     except Exception as e:
-        print(f"Fallback extraction also failed: {e}")
-        return "Error: Unable to extract text from the PDF document."
\ No newline at end of file
+        print(f"Text layer extraction also failed: {e}")
+        yield {
+            "page_idx": start_page,
+            "pages_total": start_page + 1,
+            "markdown": "Error: Unable to extract text from the PDF document.",
+        }
+        return
+    
+    for offset, text in enumerate(texts):
+        yield {
+            "page_idx": start_page + offset,
+            "pages_total": pages_total,
+            "markdown": text.strip(),
+        }
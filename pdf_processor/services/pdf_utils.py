@@ -0,0 +1,153 @@
+import re
+import hashlib
+import fitz  # PyMuPDF
+
+# Object headers ("12 0 obj") and page objects in uncompressed PDF data; "/Type /Pages"
+# (the page tree) doesn't match
+PAGE_OBJECT_PATTERN = re.compile(rb"(?<![0-9])([0-9]{1,10})\s+[0-9]{1,5}\s+obj(?![A-Za-z])|/Type\s{0,8}/Page(?![A-Za-z])")
+
+# Bytes kept between chunks so patterns split across two chunks are still found
+PREFLIGHT_OVERLAP = 64
+
+def get_page_count(pdf_bytes):
+    """
+    Count the pages of a PDF
+
+    Args:
+        pdf_bytes (bytes): PDF content
+
+    Returns:
+        int: Number of pages
+    """
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        return doc.page_count
+
+def extract_pages(pdf_bytes, page_ids):
+    """
+    Build a new PDF that contains only some pages of a PDF
+
+    Args:
+        pdf_bytes (bytes): PDF content
+        page_ids (iterable): 0-based page numbers to keep, in the order to keep them
+
+    Returns:
+        bytes: Content of the new PDF
+    """
+    # Group consecutive pages so each run is copied in one call
+    runs = []
+    for page_id in page_ids:
+        if runs and runs[-1][1] == page_id - 1:
+            runs[-1][1] = page_id
+        else:
+            runs.append([page_id, page_id])
+
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as src:
+        with fitz.open() as dst:
+            for from_page, to_page in runs:
+                dst.insert_pdf(src, from_page=from_page, to_page=to_page)
+            return dst.tobytes()
+
+def classify_pages(pdf_bytes, min_chars=50, max_invalid_ratio=0.1):
+    """
+    Decide per page whether the text layer is usable or the page needs OCR
+
+    Args:
+        pdf_bytes (bytes): PDF content
+        min_chars (int): Minimum number of non-whitespace characters for a usable text layer
+        max_invalid_ratio (float): Maximum share of unmappable characters (e.g. broken font encodings)
+
+    Returns:
+        list: 'txt' or 'ocr' for each page, in page order
+    """
+    page_modes = []
+
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        for page in doc:
+            text = "".join(page.get_text("text").split())
+            invalid = text.count("\ufffd")
+
+            if len(text) >= min_chars and invalid <= len(text) * max_invalid_ratio:
+                page_modes.append('txt')
+            else:
+                page_modes.append('ocr')
+
+    return page_modes
+
+def merge_pdfs(pdfs):
+    """
+    Concatenate several PDFs into one
+
+    Args:
+        pdfs (list): Content of each PDF, in order
+
+    Returns:
+        bytes: Content of the combined PDF
+    """
+    with fitz.open() as dst:
+        for pdf_bytes in pdfs:
+            with fitz.open(stream=pdf_bytes, filetype="pdf") as src:
+                dst.insert_pdf(src)
+        return dst.tobytes()
+
+class PdfPreflight:
+    """
+    Checks a PDF while it is copied in chunks, without holding it in memory:
+    SHA-256 of the content, size, the %PDF header and an estimate of the page
+    count from the page objects seen in the data.
+
+    The estimate is only a hint: pages stored in compressed object streams
+    can't be seen (it is then None), and pages removed by an incremental update
+    are still counted. Use get_page_count on the stored file for the real count.
+    """
+    def __init__(self):
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.header = b""
+        # Object numbers of the page objects; an incremental update rewrites a page
+        # under the same number, so each page is counted once
+        self.page_objects = set()
+        self.object_number = None
+        # Pages without their own object header, e.g. in an uncompressed object stream
+        self.unnumbered_pages = 0
+        self.tail = b""
+
+    def update(self, chunk):
+        """
+        Add the next chunk of the PDF
+
+        Args:
+            chunk (bytes): Data following the previous chunk
+        """
+        self.sha256.update(chunk)
+        if len(self.header) < 1024:
+            self.header += chunk[:1024 - len(self.header)]
+
+        # Take matches ending in the new data, except one ending at its very end,
+        # which is only taken once the next chunk shows it isn't "/Pages" or "objx"
+        data = self.tail + chunk
+        for match in PAGE_OBJECT_PATTERN.finditer(data):
+            if not len(self.tail) <= match.end() < len(data):
+                continue
+            if match.group(1) is not None:
+                self.object_number = int(match.group(1))
+            elif self.object_number is None:
+                self.unnumbered_pages += 1
+            else:
+                self.page_objects.add(self.object_number)
+                self.object_number = None
+        self.tail = data[-PREFLIGHT_OVERLAP:]
+        self.size += len(chunk)
+
+    @property
+    def is_pdf(self):
+        # The header may follow up to 1024 bytes of junk
+        return b"%PDF-" in self.header
+
+    @property
+    def estimated_page_count(self):
+        # A hint for progress and logs, never for enforcing limits
+        return len(self.page_objects) + self.unnumbered_pages or None
+
+    @property
+    def hexdigest(self):
+        return self.sha256.hexdigest()
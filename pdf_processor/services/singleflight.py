@@ -0,0 +1,76 @@
+import threading
+
+class _Call:
+    """An in-flight computation and the callers waiting for it"""
+    def __init__(self):
+        self.done = threading.Event()
+        self.callers = []
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key: the first caller runs the
+    computation, later callers wait for it and receive the same result (or
+    exception). Once the computation finishes the key is released, so calls
+    after that run again (or hit a cache).
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, func, caller=None):
+        """
+        Run func for a key, or wait for the call already running for it
+
+        Args:
+            key (str): Key identifying the computation (e.g. a content hash)
+            func (callable): Computation to run if no call for the key is in flight
+            caller: Identifier of the caller (e.g. a job id), listed by callers()
+
+        Returns:
+            tuple: (result, shared) where shared is True if another caller ran func
+
+        Raises:
+            Exception: Whatever func raised, for the caller that ran it and every waiting caller
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self.calls[key] = call
+            if caller is not None:
+                call.callers.append(caller)
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+        return call.result, False
+
+    def callers(self, key):
+        """
+        Get the callers sharing the call in flight for a key
+
+        Args:
+            key (str): Key identifying the computation
+
+        Returns:
+            list: Caller identifiers, the running caller first (empty if nothing is in flight)
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            return list(call.callers) if call else []
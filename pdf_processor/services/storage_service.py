@@ -1,24 +1,45 @@
+import io
 import os
-import boto3
+import mmap
+from botocore.exceptions import ClientError
 import tempfile
 from werkzeug.utils import secure_filename
+from aws_clients import get_s3_client, get_transfer_config, S3_MULTIPART_THRESHOLD
+from disk_cache import DiskCache
+from compression import compress, decompress, get_dictionary_id
 
-# Initialize S3 client
-s3 = boto3.client('s3')
+# Shared S3 client and multipart transfer settings
+s3 = get_s3_client()
+transfer_config = get_transfer_config()
 
 # Get bucket names from environment variables
 PDF_BUCKET = os.environ.get('PDF_BUCKET', 'pdf-processor-pdfs')
 TEXT_BUCKET = os.environ.get('TEXT_BUCKET', 'pdf-processor-texts')
 SUMMARY_BUCKET = os.environ.get('SUMMARY_BUCKET', 'pdf-processor-summaries')
 
-def save_file(file_obj, folder, filename=None):
+# Size of the chunks uploads are copied in
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Optional local cache of S3 objects on this node, revalidated by ETag on every read
+S3_CACHE_DIR = os.environ.get('S3_CACHE_DIR')
+S3_CACHE_MAX_MB = int(os.environ.get('S3_CACHE_MAX_MB', 1024))
+s3_cache = DiskCache(S3_CACHE_DIR, S3_CACHE_MAX_MB * 1024 * 1024) if S3_CACHE_DIR else None
+
+# Compressed local files start with this marker and a line naming the encoding and zstd dictionary
+LOCAL_ENCODING_MARKER = b"\x00pdf-processor-encoding "
+
+def save_file(file_obj, folder, filename=None, on_chunk=None):
     """
     Save a file to S3 or local storage depending on environment
     
+    The file is copied in chunks of UPLOAD_CHUNK_SIZE (as a multipart upload on
+    S3), so memory use stays flat however large the file is.
+    
     Args:
         file_obj: Flask file object or file-like object
         folder (str): Target folder path or S3 prefix
         filename (str, optional): Filename to use. If None, uses the original filename.
+        on_chunk (callable, optional): Called with each chunk of the content as it is copied
         
     Returns:
         str: Full path to the saved file (S3 URI or local path)
@@ -38,13 +59,15 @@ def save_file(file_obj, folder, filename=None):
         bucket = PDF_BUCKET
         key = f"{folder.strip('/')}/{filename}"
         
-        # Handle file-like objects vs Flask file objects
+        # Handle file-like objects (including Flask file objects) vs paths
         if hasattr(file_obj, 'read'):
-            # File-like object
-            s3.upload_fileobj(file_obj, bucket, key)
+            s3.upload_fileobj(_ChunkReader(file_obj, on_chunk), bucket, key, Config=transfer_config)
+        elif on_chunk:
+            with open(file_obj, 'rb') as f:
+                s3.upload_fileobj(_ChunkReader(f, on_chunk), bucket, key, Config=transfer_config)
         else:
             # Assume it's a path
-            s3.upload_file(file_obj, bucket, key)
+            s3.upload_file(file_obj, bucket, key, Config=transfer_config)
             
         return f"s3://{bucket}/{key}"
     else:
@@ -52,20 +75,42 @@ def save_file(file_obj, folder, filename=None):
         os.makedirs(folder, exist_ok=True)
         file_path = os.path.join(folder, filename)
         
-        if hasattr(file_obj, 'save'):
-            # Flask file object
-            file_obj.save(file_path)
-        elif hasattr(file_obj, 'read'):
-            # File-like object
+        if hasattr(file_obj, 'read'):
+            # Flask file object or file-like object
             with open(file_path, 'wb') as f:
-                f.write(file_obj.read())
+                _copy_stream(file_obj, f, on_chunk)
         else:
             # Assume it's a path
-            import shutil
-            shutil.copy(file_obj, file_path)
+            with open(file_obj, 'rb') as source, open(file_path, 'wb') as f:
+                _copy_stream(source, f, on_chunk)
             
         return file_path
 
+class _ChunkReader:
+    """
+    Read-only wrapper of a stream that passes every chunk read to a callback.
+    It has no seek, so boto3 reads it once, in order, one part at a time.
+    """
+    def __init__(self, stream, on_chunk=None):
+        self.stream = stream
+        self.on_chunk = on_chunk
+    
+    def read(self, size=-1):
+        chunk = self.stream.read(size)
+        if chunk and self.on_chunk:
+            self.on_chunk(chunk)
+        return chunk
+
+def _copy_stream(source, target, on_chunk=None):
+    # Copy a stream in fixed-size chunks
+    while True:
+        chunk = source.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        if on_chunk:
+            on_chunk(chunk)
+        target.write(chunk)
+
 def get_file_path(folder, filename):
     """
     Get the full path for a file
@@ -84,6 +129,22 @@ def get_file_path(folder, filename):
     else:
         return os.path.join(folder, secure_filename(filename))
 
+def join_path(base, *parts):
+    """
+    Join path components onto an S3 URI or local path
+    
+    Args:
+        base (str): Base path (S3 URI or local path)
+        *parts (str): Path components to append
+        
+    Returns:
+        str: Joined path
+    """
+    if base.startswith('s3://'):
+        return '/'.join([base.rstrip('/')] + [part.strip('/') for part in parts])
+    else:
+        return os.path.join(base, *parts)
+
 def delete_file(file_path):
     """
     Delete a file from S3 or local storage
@@ -100,6 +161,9 @@ def delete_file(file_path):
         bucket = parts[0]
         key = parts[1]
         
+        if s3_cache:
+            s3_cache.remove(file_path)
+        
         try:
             s3.delete_object(Bucket=bucket, Key=key)
             return True
@@ -119,7 +183,7 @@ def delete_file(file_path):
 
 def read_file(file_path):
     """
-    Read a file from S3 or local storage
+    Read a file from S3 or local storage, decompressing it if write_file compressed it
     
     Args:
         file_path (str): Path to the file to read (S3 URI or local path)
@@ -133,17 +197,149 @@ def read_file(file_path):
         bucket = parts[0]
         key = parts[1]
         
-        response = s3.get_object(Bucket=bucket, Key=key)
-        return response['Body'].read()
+        if not s3_cache:
+            response = s3.get_object(Bucket=bucket, Key=key)
+            return _decode(response['Body'].read(), _get_encoding_metadata(response))
+        
+        # Serve the local copy unless S3 has a different version
+        cached = s3_cache.read(file_path)
+        try:
+            if cached:
+                response = s3.get_object(Bucket=bucket, Key=key, IfNoneMatch=cached[0])
+            else:
+                response = s3.get_object(Bucket=bucket, Key=key)
+        except ClientError as e:
+            if cached and _is_not_modified(e):
+                return _decode(cached[1], cached[2])
+            raise
+        
+        content = response['Body'].read()
+        metadata = _get_encoding_metadata(response)
+        s3_cache.put(file_path, response.get('ETag'), content, metadata)
+        return _decode(content, metadata)
     else:
         # Local path
         with open(file_path, 'rb') as f:
-            return f.read()
+            content = f.read()
+        if not content.startswith(LOCAL_ENCODING_MARKER):
+            return content
+        header, _, content = content[len(LOCAL_ENCODING_MARKER):].partition(b"\n")
+        encoding, dictionary_id = header.decode('ascii').split(" ")
+        return decompress(content, encoding, int(dictionary_id))
+
+def open_buffer(file_path):
+    """
+    Open a file as a read-only buffer, without copying it into a bytes object
+    
+    Local files are memory-mapped, so their pages are read from disk as they are
+    used. S3 objects are downloaded straight into one preallocated buffer (as
+    parallel ranged parts for large objects), with no temporary file. The
+    content is not decompressed; this is meant for PDFs, which write_file
+    stores as they are.
+    
+    Args:
+        file_path (str): Path to the file to read (S3 URI or local path)
+        
+    Returns:
+        FileBuffer: Use as a context manager, which gives a memoryview of the
+            content that works wherever PDF bytes are accepted (PymuDocDataset,
+            PyMuPDF, hashlib), or read .view and call close() when done. PyMuPDF
+            documents opened on it must be closed before the buffer is.
+    """
+    if file_path.startswith('s3://'):
+        # S3 path
+        parts = file_path[5:].split('/', 1)
+        bucket = parts[0]
+        key = parts[1]
+        
+        head = s3.head_object(Bucket=bucket, Key=key)
+        
+        # Map the local copy if it is still the current version
+        if s3_cache:
+            cached = s3_cache.map(file_path)
+            if cached and cached[0] == head['ETag']:
+                etag, mapped, offset = cached
+                with memoryview(mapped) as view:
+                    return FileBuffer(view[offset:], mapped)
+            if cached:
+                cached[1].close()
+        
+        buffer = bytearray(head['ContentLength'])
+        
+        # Pin the version that was sized, in case the object is replaced meanwhile
+        extra_args = {'VersionId': head['VersionId']} if head.get('VersionId') else None
+        s3.download_fileobj(bucket, key, _BufferWriter(buffer), ExtraArgs=extra_args, Config=transfer_config)
+        if s3_cache:
+            s3_cache.put(file_path, head['ETag'], buffer, _get_encoding_metadata(head))
+        return FileBuffer(memoryview(buffer).toreadonly())
+    else:
+        # Local path; empty files can't be mapped
+        with open(file_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return FileBuffer(memoryview(b""))
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return FileBuffer(memoryview(mapped), mapped)
+
+class FileBuffer:
+    """
+    Read-only content of a file opened with open_buffer
+    """
+    def __init__(self, view, mapped=None):
+        self.view = view
+        self.mapped = mapped
+    
+    def close(self):
+        # PyMuPDF reads the buffer without holding a reference to it, so any document
+        # opened on it must be closed first (see ocr_engine.open_dataset); using it
+        # afterwards would read freed memory. Memoryview slices that callers still
+        # hold keep the mapping open; it is then closed once they are collected.
+        try:
+            self.view.release()
+            if self.mapped is not None:
+                self.mapped.close()
+        except BufferError:
+            pass
+    
+    def __enter__(self):
+        return self.view
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+class _BufferWriter:
+    """
+    Seekable file-like writer over a preallocated buffer, so boto3 can write
+    the parts of a ranged download at their offsets
+    """
+    def __init__(self, buffer):
+        self.view = memoryview(buffer)
+        self.position = 0
+    
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += len(self.view)
+        self.position = offset
+        return self.position
+    
+    def tell(self):
+        return self.position
+    
+    def write(self, data):
+        size = len(data)
+        self.view[self.position:self.position + size] = data
+        self.position += size
+        return size
 
 def write_file(file_path, content, content_type=None):
     """
     Write content to a file in S3 or local storage
     
+    Text and JSON are compressed (zstd, or gzip if zstandard isn't installed),
+    and the encoding is recorded in the S3 metadata or a header line on local
+    files; read_file decompresses them.
+    
     Args:
         file_path (str): Path to write to (S3 URI or local path)
         content (bytes or str): Content to write
@@ -158,6 +354,10 @@ def write_file(file_path, content, content_type=None):
         if content_type is None:
             content_type = 'text/plain'
     
+    size = len(content)
+    content, encoding = compress(content, content_type)
+    dictionary_id = get_dictionary_id() if encoding == 'zstd' else 0
+    
     if file_path.startswith('s3://'):
         # S3 path
         parts = file_path[5:].split('/', 1)
@@ -167,8 +367,24 @@ def write_file(file_path, content, content_type=None):
         extra_args = {}
         if content_type:
             extra_args['ContentType'] = content_type
+        if encoding:
+            extra_args['ContentEncoding'] = encoding
+            extra_args['Metadata'] = {'uncompressed-size': str(size), 'compression': encoding}
+            if dictionary_id:
+                extra_args['Metadata']['zstd-dictionary-id'] = str(dictionary_id)
         
-        s3.put_object(Bucket=bucket, Key=key, Body=content, **extra_args)
+        if len(content) > S3_MULTIPART_THRESHOLD:
+            # Large content is uploaded as parallel parts
+            s3.upload_fileobj(io.BytesIO(content), bucket, key, ExtraArgs=extra_args, Config=transfer_config)
+            if s3_cache:
+                # Multipart uploads don't return the ETag; the next read fetches it
+                s3_cache.remove(file_path)
+        else:
+            response = s3.put_object(Bucket=bucket, Key=key, Body=content, **extra_args)
+            if s3_cache:
+                # Write through, so the next read only has to revalidate
+                metadata = {'encoding': encoding, 'dictionary_id': dictionary_id}
+                s3_cache.put(file_path, response.get('ETag'), content, metadata)
         return file_path
     else:
         # Local path
@@ -176,9 +392,90 @@ def write_file(file_path, content, content_type=None):
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
         
         with open(file_path, 'wb') as f:
+            # Mark compressed files, and files that happen to start with the marker
+            if encoding or content.startswith(LOCAL_ENCODING_MARKER):
+                f.write(LOCAL_ENCODING_MARKER + f"{encoding or 'none'} {dictionary_id}\n".encode('ascii'))
             f.write(content)
         return file_path
 
+def file_exists(file_path):
+    """
+    Check whether a file exists in S3 or local storage
+    
+    Args:
+        file_path (str): Path to the file (S3 URI or local path)
+        
+    Returns:
+        bool: True if the file exists, False otherwise
+    """
+    if file_path.startswith('s3://'):
+        # S3 path
+        parts = file_path[5:].split('/', 1)
+        bucket = parts[0]
+        key = parts[1]
+        
+        try:
+            s3.head_object(Bucket=bucket, Key=key)
+            return True
+        except ClientError:
+            return False
+    else:
+        # Local path
+        return os.path.exists(file_path)
+
+def list_files(folder):
+    """
+    List the files stored under a folder or S3 prefix
+    
+    Args:
+        folder (str): Folder path, S3 prefix or s3:// URI
+        
+    Returns:
+        list: One dict per file with 'path', 'size' (bytes) and 'modified' (unix time)
+    """
+    files = []
+    
+    if folder.startswith('s3://') or 'AWS_LAMBDA_FUNCTION_NAME' in os.environ:
+        # S3 prefix
+        if folder.startswith('s3://'):
+            parts = folder[5:].split('/', 1)
+            bucket = parts[0]
+            prefix = parts[1] if len(parts) > 1 else ''
+        else:
+            bucket = determine_bucket(folder)
+            prefix = folder.strip('/')
+        if prefix and not prefix.endswith('/'):
+            prefix += '/'
+        
+        paginator = s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                files.append({
+                    'path': f"s3://{bucket}/{obj['Key']}",
+                    'size': obj['Size'],
+                    'modified': obj['LastModified'].timestamp()
+                })
+    else:
+        # Local folder
+        if not os.path.isdir(folder):
+            return files
+        
+        for root, dirs, names in os.walk(folder):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    # File removed while listing
+                    continue
+                files.append({
+                    'path': path,
+                    'size': stat.st_size,
+                    'modified': stat.st_mtime
+                })
+    
+    return files
+
 def download_to_temp(file_path):
     """
     Download a file from S3 to a temporary file
@@ -201,8 +498,8 @@ def download_to_temp(file_path):
         temp_path = temp_file.name
         temp_file.close()
         
-        # Download to the temp file
-        s3.download_file(bucket, key, temp_path)
+        # Download to the temp file, as parallel ranged parts for large files
+        s3.download_file(bucket, key, temp_path, Config=transfer_config)
         return temp_path
     else:
         # If it's already a local path, just return it
@@ -226,4 +523,22 @@ def determine_bucket(folder):
     elif 'summar' in folder_lower:
         return SUMMARY_BUCKET
     else:
-        return PDF_BUCKET  # Default
\ No newline at end of file
+        return PDF_BUCKET  # Default
+
+def _get_encoding_metadata(response):
+    # Compression of an S3 object, from the metadata write_file sets or its Content-Encoding
+    metadata = response.get('Metadata') or {}
+    dictionary_id = metadata.get('zstd-dictionary-id')
+    return {
+        'encoding': metadata.get('compression') or response.get('ContentEncoding'),
+        'dictionary_id': int(dictionary_id) if dictionary_id else None,
+    }
+
+def _decode(content, metadata):
+    # Decompress content read from S3 or the disk cache
+    return decompress(content, metadata.get('encoding'), metadata.get('dictionary_id'))
+
+def _is_not_modified(error):
+    # S3 answers a matching If-None-Match with 304 Not Modified
+    return error.response.get('ResponseMetadata', {}).get('HTTPStatusCode') == 304 \
+        or error.response.get('Error', {}).get('Code') in ('304', 'NotModified')
@@ -0,0 +1,89 @@
+import threading
+
+class TokenStream:
+    """
+    The text of a summary as it is generated, shared between the worker that
+    generates it and any number of clients reading it. Readers can join at any
+    point and read from any offset.
+    """
+    def __init__(self):
+        self.text = ""
+        self.done = False
+        self.condition = threading.Condition()
+
+    def append(self, token):
+        """
+        Add generated text and wake up waiting readers
+
+        Args:
+            token (str): Text to append
+        """
+        with self.condition:
+            self.text += token
+            self.condition.notify_all()
+
+    def close(self):
+        """Mark the stream as complete and wake up waiting readers"""
+        with self.condition:
+            self.done = True
+            self.condition.notify_all()
+
+    def wait(self, offset, timeout=None):
+        """
+        Wait until there is text past an offset or the stream is complete
+
+        Args:
+            offset (int): Number of characters the reader already has
+            timeout (float): Seconds to wait before returning with no new text
+
+        Returns:
+            tuple: (new text after offset, whether the stream is complete)
+        """
+        with self.condition:
+            if len(self.text) <= offset and not self.done:
+                self.condition.wait(timeout)
+            return self.text[offset:], self.done
+
+# Streams of the summaries being generated in this process, by job id
+_streams = {}
+_streams_lock = threading.Lock()
+
+def open_token_stream(job_id):
+    """
+    Create the stream of a job's summary
+
+    Args:
+        job_id (str): Job ID
+
+    Returns:
+        TokenStream: The new stream
+    """
+    stream = TokenStream()
+    with _streams_lock:
+        _streams[job_id] = stream
+    return stream
+
+def get_token_stream(job_id):
+    """
+    Get the stream of a summary being generated in this process
+
+    Args:
+        job_id (str): Job ID
+
+    Returns:
+        TokenStream: The stream, or None if the job is not generating a summary here
+    """
+    with _streams_lock:
+        return _streams.get(job_id)
+
+def close_token_stream(job_id):
+    """
+    Complete a job's stream and stop tracking it; readers holding the stream can still finish reading it
+
+    Args:
+        job_id (str): Job ID
+    """
+    with _streams_lock:
+        stream = _streams.pop(job_id, None)
+    if stream:
+        stream.close()
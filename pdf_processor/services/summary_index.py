@@ -0,0 +1,372 @@
+import os
+import re
+import json
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from storage_service import read_file, write_file
+from summary_service import (
+    GROK_API_KEY, GROK_MODEL, GROK_TEMPERATURE, SYSTEM_PROMPT,
+    SUMMARY_CHUNK_TOKENS, SUMMARY_CONCURRENCY, SUMMARY_TOKEN_BUDGET,
+    SUMMARY_COMPRESS_RATIO, SUMMARY_COMPRESS_MIN_TOKENS,
+    estimate_tokens, split_into_chunks, compress_text, compress_for_prompt,
+    get_cached_summary, cache_summary, request_completion, stream_completion,
+    map_reduce_prompt, generate_mock_summary
+)
+
+logger = logging.getLogger()
+
+# Build section summary indexes for documents with at least this many headings
+SUMMARY_INDEX_MIN_SECTIONS = int(os.environ.get("SUMMARY_INDEX_MIN_SECTIONS", 2))
+
+# Sections shorter than this are used as they are instead of being summarised
+SECTION_MIN_TOKENS = int(os.environ.get("SECTION_MIN_TOKENS", 300))
+
+# Length of offline section summaries when no API key is configured
+SECTION_FALLBACK_TOKENS = 150
+
+SECTION_PROMPT = (
+    "The following text is the section \"{title}\" of a document extracted from a PDF. "
+    "Summarize this section, keeping its main points, key findings, figures and important details.\n\nTEXT:\n{text}"
+)
+COMBINE_PROMPT = (
+    "The following are summaries of the section \"{title}\" of a document extracted from a PDF "
+    "and of its subsections. Combine them into one summary of the section.\n\nSUMMARIES:\n{text}"
+)
+VARIANT_PROMPT = (
+    "The following are summaries of the sections of a document extracted from a PDF, under their "
+    "headings. Using them, write a summary of the whole document {length}.{focus}\n\nSECTION SUMMARIES:\n{text}"
+)
+
+# Summary lengths a variant can ask for
+SUMMARY_LENGTHS = {
+    "short": "in one paragraph",
+    "medium": "in three to five paragraphs, focusing on the main points, key findings, and important details",
+    "long": "in detail, section by section",
+}
+
+HEADING_LINE_PATTERN = re.compile(r"^(#{1,6})\s+(.*)$")
+
+def has_sections(markdown):
+    """
+    Check whether a document has enough headings for a section index
+    """
+    headings = sum(1 for line in markdown.split("\n") if HEADING_LINE_PATTERN.match(line.strip()))
+    return headings >= SUMMARY_INDEX_MIN_SECTIONS
+
+def parse_sections(markdown):
+    """
+    Build the section tree of a markdown document from its headings
+
+    Args:
+        markdown (str): Markdown text
+
+    Returns:
+        dict: Root node; every node has 'title', 'level', 'text' (its own text,
+            without subsections) and 'children'
+    """
+    root = {"title": "", "level": 0, "lines": [], "children": []}
+    stack = [root]
+
+    for line in markdown.split("\n"):
+        match = HEADING_LINE_PATTERN.match(line.strip())
+        if not match:
+            stack[-1]["lines"].append(line)
+            continue
+
+        level = len(match.group(1))
+        while stack[-1]["level"] >= level:
+            stack.pop()
+        node = {"title": match.group(2).strip(), "level": level, "lines": [], "children": []}
+        stack[-1]["children"].append(node)
+        stack.append(node)
+
+    def finish(node):
+        node["text"] = "\n".join(node.pop("lines")).strip()
+        for child in node["children"]:
+            finish(child)
+        return node
+
+    return finish(root)
+
+def build_summary_index(markdown, previous=None):
+    """
+    Summarise every section of a document and combine the summaries up the heading tree
+
+    Each section is identified by a hash of its text, and each node by a hash of
+    its own text and its subsections (a Merkle tree), so only sections whose text
+    changed are summarised again: unchanged ones are reused from the previous
+    index or the summary cache.
+
+    Args:
+        markdown (str): Markdown text
+        previous (dict, optional): Earlier index of the same document
+
+    Returns:
+        dict: Index with 'hash' (of the whole document), 'root' (the section tree, each
+            node with 'title', 'level', 'hash', 'tokens', 'text_summary' of its own
+            text, 'summary' including subsections and 'children') and 'stats'
+    """
+    root = parse_sections(markdown)
+    nodes = []
+
+    # Hash the tree bottom-up
+    def visit(node, depth):
+        for child in node["children"]:
+            visit(child, depth + 1)
+        normalized = " ".join(node["text"].split())
+        node["text_hash"] = _hash(node["title"], normalized)
+        node["hash"] = _hash(node["text_hash"], *[child["hash"] for child in node["children"]])
+        node["tokens"] = estimate_tokens(node["text"]) if node["text"] else 0
+        node["depth"] = depth
+        nodes.append(node)
+
+    visit(root, 0)
+
+    # Summaries of the previous index, by hash
+    reuse = {}
+    if previous:
+        def collect(node):
+            reuse[("text", node["text_hash"])] = node.get("text_summary", "")
+            reuse[("node", node["hash"])] = node.get("summary", "")
+            for child in node.get("children", []):
+                collect(child)
+        collect(previous["root"])
+
+    def summarise_text(node):
+        key = ("text", node["text_hash"])
+        if key in reuse:
+            return reuse[key], "reused"
+        if node["tokens"] < SECTION_MIN_TOKENS:
+            return node["text"], None
+        summary, cached = _summarise_section(node)
+        return summary, "reused" if cached else "summarised"
+
+    stats = {"sections": len(nodes), "summarised": 0, "reused": 0}
+
+    # Summarise the text of every section in parallel
+    with ThreadPoolExecutor(max_workers=max(1, SUMMARY_CONCURRENCY)) as executor:
+        for node, (summary, status) in zip(nodes, executor.map(summarise_text, nodes)):
+            node["text_summary"] = summary
+            if status:
+                stats[status] += 1
+
+        # Combine each section with its subsections, deepest first. The whole
+        # document is only combined when a summary variant is composed.
+        root["summary"] = ""
+        for depth in sorted({node["depth"] for node in nodes if node["depth"]}, reverse=True):
+            level_nodes = [node for node in nodes if node["depth"] == depth]
+            for node, summary in zip(level_nodes, executor.map(lambda node: _combine_node(node, reuse), level_nodes)):
+                node["summary"] = summary
+
+    for node in nodes:
+        del node["depth"]
+        del node["text"]
+
+    logger.info(
+        f"Summary index: {stats['sections']} sections, {stats['summarised']} summarised, {stats['reused']} reused"
+    )
+    return {"hash": root["hash"], "root": root, "stats": stats}
+
+def _summarise_section(node):
+    """
+    Summarise the own text of one section, using the summary cache
+
+    Returns:
+        tuple: (summary, whether it came from the cache)
+    """
+    cache_key = _cache_key("section", node["text_hash"])
+    cached = get_cached_summary(cache_key)
+    if cached:
+        return cached, True
+
+    if not GROK_API_KEY:
+        return compress_text(node["text"], SECTION_FALLBACK_TOKENS), False
+
+    # Long sections are compressed like whole documents, then summarised with
+    # map-reduce, which keeps the map stage within SUMMARY_TOKEN_BUDGET
+    text = compress_for_prompt(node["text"])
+    chunks = split_into_chunks(text, SUMMARY_CHUNK_TOKENS)
+    if len(chunks) <= 1:
+        prompt = SECTION_PROMPT.format(title=node["title"], text=text)
+    else:
+        prompt = map_reduce_prompt(chunks)
+
+    summary = request_completion(prompt)
+    if summary:
+        cache_summary(cache_key, summary)
+    return summary, False
+
+def _combine_node(node, reuse):
+    """
+    Summary of a node including its subsections
+    """
+    parts = [node["text_summary"]] if node["text_summary"] else []
+    parts += [f"{child['title']}: {child['summary']}" for child in node["children"] if child["summary"]]
+    if not node["children"] or estimate_tokens("\n\n".join(parts)) < SECTION_MIN_TOKENS:
+        return "\n\n".join(parts)
+
+    key = ("node", node["hash"])
+    if key in reuse:
+        return reuse[key]
+
+    cache_key = _cache_key("node", node["hash"])
+    cached = get_cached_summary(cache_key)
+    if cached:
+        return cached
+
+    if not GROK_API_KEY:
+        return compress_text("\n\n".join(parts), SECTION_FALLBACK_TOKENS)
+
+    # Sections with many subsections can exceed the budget, so their summaries are shortened too
+    text = compress_text("\n\n".join(parts), SUMMARY_TOKEN_BUDGET)
+    summary = request_completion(COMBINE_PROMPT.format(title=node["title"] or "whole document", text=text))
+    if summary:
+        cache_summary(cache_key, summary)
+    return summary
+
+def compose_summary(index, focus=None, length="medium"):
+    """
+    Write a summary variant from the section summaries of an index
+
+    Only the section summaries are sent, so a new focus or length costs one
+    small request instead of summarising the document again.
+
+    Args:
+        index (dict): Index from build_summary_index
+        focus (str, optional): Topic the summary should focus on
+        length (str): One of SUMMARY_LENGTHS
+
+    Returns:
+        str: The summary
+    """
+    cache_key = _cache_key("variant", index["hash"], focus or "", length)
+    cached = get_cached_summary(cache_key)
+    if cached:
+        return cached
+
+    outline = _render_outline(index)
+    if not GROK_API_KEY:
+        logger.warning("Grok X API key not configured")
+        return generate_mock_summary(outline)
+
+    summary = request_completion(_variant_prompt(outline, focus, length))
+    if summary:
+        cache_summary(cache_key, summary)
+    return summary
+
+def stream_composed_summary(index, focus=None, length="medium"):
+    """
+    Write a summary variant from the section summaries of an index, yielding it token by token
+
+    Args:
+        index (dict): Index from build_summary_index
+        focus (str, optional): Topic the summary should focus on
+        length (str): One of SUMMARY_LENGTHS
+
+    Yields:
+        str: Pieces of the summary, in order
+    """
+    cache_key = _cache_key("variant", index["hash"], focus or "", length)
+    cached = get_cached_summary(cache_key)
+    if cached:
+        yield cached
+        return
+
+    outline = _render_outline(index)
+    if not GROK_API_KEY:
+        logger.warning("Grok X API key not configured")
+        yield generate_mock_summary(outline)
+        return
+
+    tokens = []
+    for token in stream_completion(_variant_prompt(outline, focus, length)):
+        tokens.append(token)
+        yield token
+
+    summary = "".join(tokens).strip()
+    if summary:
+        cache_summary(cache_key, summary)
+
+def _render_outline(index):
+    """
+    Section summaries under their headings; falls back to the combined summaries
+    of the top-level sections when every section does not fit in the token budget
+    """
+    lines = []
+
+    def render(node, depth, max_depth):
+        if depth:
+            lines.append(f"{'#' * node['level']} {node['title']}")
+        if depth == max_depth:
+            if node["summary"]:
+                lines.append(node["summary"])
+            return
+        if node["text_summary"]:
+            lines.append(node["text_summary"])
+        for child in node["children"]:
+            render(child, depth + 1, max_depth)
+
+    render(index["root"], 0, None)
+    outline = "\n\n".join(lines)
+    if estimate_tokens(outline) <= SUMMARY_TOKEN_BUDGET:
+        return outline
+
+    lines = []
+    render(index["root"], 0, 1)
+    return "\n\n".join(lines)
+
+def _variant_prompt(outline, focus, length):
+    return VARIANT_PROMPT.format(
+        length=SUMMARY_LENGTHS.get(length, SUMMARY_LENGTHS["medium"]),
+        focus=f" Focus on {focus}." if focus else "",
+        text=outline
+    )
+
+def _hash(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode('utf-8'))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def _cache_key(kind, *parts):
+    # Section summaries depend on the prompts and model settings as well as the text
+    params = json.dumps({
+        'system_prompt': SYSTEM_PROMPT,
+        'prompts': [SECTION_PROMPT, COMBINE_PROMPT, VARIANT_PROMPT],
+        'model': GROK_MODEL,
+        'temperature': GROK_TEMPERATURE,
+        'budget': [SUMMARY_CHUNK_TOKENS, SUMMARY_TOKEN_BUDGET, SUMMARY_COMPRESS_RATIO, SUMMARY_COMPRESS_MIN_TOKENS],
+    }, sort_keys=True)
+    return _hash(kind, params, *parts)
+
+def load_summary_index(path):
+    """
+    Load a saved summary index
+
+    Args:
+        path (str): Path of the index (S3 URI or local path)
+
+    Returns:
+        dict: The index, or None if it can't be read
+    """
+    try:
+        return json.loads(read_file(path).decode('utf-8'))
+    except Exception as e:
+        logger.warning(f"No summary index at {path}: {e}")
+        return None
+
+def save_summary_index(path, index):
+    """
+    Save a summary index
+
+    Args:
+        path (str): Path of the index (S3 URI or local path)
+        index (dict): Index from build_summary_index
+
+    Returns:
+        str: Path of the saved index
+    """
+    return write_file(path, json.dumps(index, ensure_ascii=False), "application/json")
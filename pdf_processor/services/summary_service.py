@@ -1,6 +1,17 @@
 import os
+import re
+import json
+import hashlib
+import asyncio
+import threading
 import requests
+import aiohttp
 import logging
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from cache_service import StorageCache, LRUCache
+from llm_scheduler import RequestScheduler
 from dotenv import load_dotenv
 
 # Set up logging
@@ -15,112 +26,893 @@ if not os.environ.get('AWS_LAMBDA_FUNCTION_NAME'):
 GROK_API_URL = os.environ.get("GROK_API_URL", "https://api.x.ai/v1/chat/completions")
 GROK_API_KEY = os.environ.get("GROK_API_KEY")
 
+# Map-reduce settings: documents longer than one chunk are split into chunks of about
+# SUMMARY_CHUNK_TOKENS tokens, summarised by up to SUMMARY_CONCURRENCY parallel requests,
+# and the partial summaries are combined SUMMARY_REDUCE_FANIN at a time.
+# SUMMARY_TOKEN_BUDGET caps the document tokens sent in the map stage.
+SUMMARY_CHUNK_TOKENS = int(os.environ.get("SUMMARY_CHUNK_TOKENS", 3000))
+SUMMARY_CONCURRENCY = int(os.environ.get("SUMMARY_CONCURRENCY", 4))
+SUMMARY_REDUCE_FANIN = int(os.environ.get("SUMMARY_REDUCE_FANIN", 8))
+SUMMARY_TOKEN_BUDGET = int(os.environ.get("SUMMARY_TOKEN_BUDGET", 120000))
+
+# Connection pool settings for the Grok X API clients. Connections are kept alive
+# and reused across requests (and across warm Lambda invocations).
+GROK_POOL_SIZE = int(os.environ.get("GROK_POOL_SIZE", 16))
+GROK_KEEPALIVE_SECONDS = int(os.environ.get("GROK_KEEPALIVE_SECONDS", 60))
+GROK_MODEL = "grok-2-latest"
+GROK_TEMPERATURE = 0.3
+
+# Add a longer timeout for Lambda environments
+GROK_TIMEOUT = 60 if os.environ.get('AWS_LAMBDA_FUNCTION_NAME') else 30
+
+# Provider limits shared by every request from this process: requests and tokens
+# per minute, concurrent requests, and how failed requests are retried
+GROK_REQUESTS_PER_MINUTE = int(os.environ.get("GROK_REQUESTS_PER_MINUTE", 60))
+GROK_TOKENS_PER_MINUTE = int(os.environ.get("GROK_TOKENS_PER_MINUTE", 100000))
+GROK_MAX_CONCURRENCY = int(os.environ.get("GROK_MAX_CONCURRENCY", 8))
+GROK_MAX_RETRIES = int(os.environ.get("GROK_MAX_RETRIES", 5))
+GROK_BACKOFF_BASE = float(os.environ.get("GROK_BACKOFF_BASE", 1.0))
+GROK_BACKOFF_MAX = float(os.environ.get("GROK_BACKOFF_MAX", 60.0))
+
+# Tokens a summary response is expected to use, counted against the token limit
+GROK_RESPONSE_TOKENS = 1000
+
+grok_scheduler = RequestScheduler(
+    requests_per_minute=GROK_REQUESTS_PER_MINUTE,
+    tokens_per_minute=GROK_TOKENS_PER_MINUTE,
+    max_concurrency=GROK_MAX_CONCURRENCY,
+    max_retries=GROK_MAX_RETRIES,
+    backoff_base=GROK_BACKOFF_BASE,
+    backoff_max=GROK_BACKOFF_MAX
+)
+
+SYSTEM_PROMPT = "You are a helpful assistant that creates concise summaries of documents."
+SUMMARY_PROMPT = (
+    "Please provide a comprehensive summary of the following text extracted from a PDF. "
+    "Focus on the main points, key findings, and important details.\n\nTEXT:\n{text}"
+)
+CHUNK_PROMPT = (
+    "The following text is part {part} of {parts} of a document extracted from a PDF. "
+    "Summarize this part, keeping its main points, key findings, figures and important details.\n\nTEXT:\n{text}"
+)
+REDUCE_PROMPT = (
+    "The following are summaries of consecutive parts of a document extracted from a PDF. "
+    "Combine them into one comprehensive summary of the whole document. Focus on the main points, "
+    "key findings, and important details.\n\nSUMMARIES:\n{text}"
+)
+
+# Extractive compression: documents over SUMMARY_COMPRESS_MIN_TOKENS tokens are cut to
+# SUMMARY_COMPRESS_RATIO of their length (and always to SUMMARY_TOKEN_BUDGET) by keeping
+# their highest-ranked sentences before they are sent to the API
+SUMMARY_COMPRESS_RATIO = float(os.environ.get("SUMMARY_COMPRESS_RATIO", 0.6))
+SUMMARY_COMPRESS_MIN_TOKENS = int(os.environ.get("SUMMARY_COMPRESS_MIN_TOKENS", 4000))
+
+# Length of the offline extractive summary
+FALLBACK_SUMMARY_TOKENS = int(os.environ.get("FALLBACK_SUMMARY_TOKENS", 400))
+
+# Sentences are ranked with TextRank up to this many sentences, and by similarity
+# to the document's TF-IDF centroid above it (TextRank needs an n x n matrix)
+TEXTRANK_MAX_SENTENCES = 1500
+
+# Sentences repeated this many times are running headers, footers or boilerplate
+BOILERPLATE_MIN_REPEATS = 3
+
+# Summary cache: recent summaries are kept in memory, all summaries in the storage
+# backend (the summaries bucket in AWS Lambda), both expiring after SUMMARY_CACHE_MAX_AGE
+SUMMARY_CACHE_ENABLED = os.environ.get('SUMMARY_CACHE_ENABLED', 'true').lower() == 'true'
+SUMMARY_CACHE_FOLDER = os.environ.get(
+    'SUMMARY_CACHE_FOLDER',
+    'summary_cache' if 'AWS_LAMBDA_FUNCTION_NAME' in os.environ
+    else os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "uploads/summary_cache")
+)
+SUMMARY_CACHE_MEMORY_ENTRIES = int(os.environ.get('SUMMARY_CACHE_MEMORY_ENTRIES', 256))
+SUMMARY_CACHE_MAX_BYTES = int(os.environ.get('SUMMARY_CACHE_MAX_BYTES', 256 * 1024 * 1024))  # 256MB
+SUMMARY_CACHE_MAX_AGE = int(os.environ.get('SUMMARY_CACHE_MAX_AGE', 30 * 24 * 60 * 60))  # 30 days
+
+summary_memory_cache = LRUCache(SUMMARY_CACHE_MEMORY_ENTRIES, max_age=SUMMARY_CACHE_MAX_AGE)
+summary_cache = StorageCache(SUMMARY_CACHE_FOLDER, max_bytes=SUMMARY_CACHE_MAX_BYTES, max_age=SUMMARY_CACHE_MAX_AGE)
+summary_cache_stats = {'memory_hits': 0, 'storage_hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+# Markdown headings start a new section
+HEADING_PATTERN = re.compile(r"^#{1,6}\s", re.MULTILINE)
+
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+WORD_PATTERN = re.compile(r"[a-z][a-z0-9]+")
+IMAGE_PATTERN = re.compile(r"^!\[[^\]]*\]\([^)]*\)$")
+STOP_WORDS = frozenset(
+    "a an and are as at be been but by can for from had has have he her his in into is it its "
+    "may more not of on or our she such that the their them then there these they this those "
+    "to was we were which while who will with would you your also than other all any each".split()
+)
+
 def generate_summary(text: str):
     """
     Generate a summary using Grok X API
     
+    Documents that do not fit in one chunk are summarised with map-reduce:
+    each chunk is summarised in parallel, then the partial summaries are combined.
+    
     Args:
         text (str): The text to summarize
         
     Returns:
         str: The generated summary
+        
+    Raises:
+        requests.exceptions.RequestException: If the API keeps failing after the scheduler's retries
     """
-    # Check if the text is too long and truncate if necessary
-    max_chars = 15000
-    if len(text) > max_chars:
-        logger.info(f"Text exceeds {max_chars} characters, truncating")
-        text = text[:max_chars] + "..."
-    
     if not GROK_API_KEY:
         logger.warning("Grok X API key not configured")
-        return _generate_mock_summary(text)
+        return generate_mock_summary(text)
+    
+    cache_key = get_summary_cache_key(text)
+    cached = get_cached_summary(cache_key)
+    if cached:
+        return cached
     
     try:
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {GROK_API_KEY}",
-        }
-        
-        # Prepare the messages for chat completion API
-        messages = [
-            {
-                "role": "system",
-                "content": "You are a helpful assistant that creates concise summaries of documents.",
-            },
-            {
-                "role": "user",
-                "content": f"Please provide a comprehensive summary of the following text extracted from a PDF. Focus on the main points, key findings, and important details.\n\nTEXT:\n{text}",
-            },
-        ]
-        
-        payload = {
-            "messages": messages,
-            "model": "grok-2-latest",
-            "stream": False,
-            "temperature": 0.3,
-        }
-        
-        # Add a longer timeout for Lambda environments
-        timeout = 60 if os.environ.get('AWS_LAMBDA_FUNCTION_NAME') else 30
-        
-        response = requests.post(
-            GROK_API_URL, headers=headers, json=payload, timeout=timeout
-        )
-        
-        # Properly handle response
-        response.raise_for_status()
-        result = response.json()
-        
-        # Extract the summary from the chat completion response
-        summary = (
-            result.get("choices", [{}])[0].get("message", {}).get("content", "").strip()
-        )
+        summary = request_completion(_build_summary_prompt(text))
         
         if not summary:
             logger.warning("No summary content found in API response")
-            return _generate_mock_summary(text)
+            return generate_mock_summary(text)
         
         logger.info("Successfully generated summary")
+        cache_summary(cache_key, summary)
         return summary
     
+    # API failures have already been retried, so report them instead of
+    # passing off a fallback summary as the real one
     except requests.exceptions.HTTPError as e:
         logger.error(f"HTTP Error: {e}")
-        logger.error(f"Response: {e.response.text if hasattr(e, 'response') else 'No response'}")
-        return _generate_mock_summary(text)
+        logger.error(f"Response: {e.response.text if e.response is not None else 'No response'}")
+        raise
     
     except requests.exceptions.ConnectionError as e:
         logger.error(f"Connection Error: {e}")
-        return _generate_mock_summary(text)
+        raise
     
     except requests.exceptions.Timeout as e:
         logger.error(f"Timeout Error: {e}")
-        return _generate_mock_summary(text)
+        raise
     
     except requests.exceptions.RequestException as e:
         logger.error(f"Request Exception: {e}")
-        return _generate_mock_summary(text)
+        raise
     
     except Exception as e:
         logger.error(f"Error generating summary: {e}")
-        return _generate_mock_summary(text)
+        return generate_mock_summary(text)
+
+def stream_summary(text: str):
+    """
+    Generate a summary using Grok X API, yielding it token by token as it is generated
+    
+    For long documents the map stage runs first and only the final combine
+    request is streamed. Cached and fallback summaries are yielded in one piece.
+    
+    Args:
+        text (str): The text to summarize
+        
+    Yields:
+        str: Pieces of the summary, in order
+    """
+    if not GROK_API_KEY:
+        logger.warning("Grok X API key not configured")
+        yield generate_mock_summary(text)
+        return
+    
+    cache_key = get_summary_cache_key(text)
+    cached = get_cached_summary(cache_key)
+    if cached:
+        yield cached
+        return
+    
+    tokens = []
+    try:
+        for token in stream_completion(_build_summary_prompt(text)):
+            tokens.append(token)
+            yield token
+    
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Summary stream failed after {len(tokens)} tokens: {e}")
+        raise
+    
+    except Exception as e:
+        # Once tokens have been delivered a fallback summary can't replace them
+        if tokens:
+            logger.error(f"Summary stream failed after {len(tokens)} tokens: {e}")
+            raise
+        logger.error(f"Error streaming summary: {e}")
+        yield generate_mock_summary(text)
+        return
+    
+    summary = "".join(tokens).strip()
+    if not summary:
+        logger.warning("No summary content found in API response")
+        yield generate_mock_summary(text)
+        return
+    
+    logger.info("Successfully generated summary")
+    cache_summary(cache_key, summary)
+
+def _build_summary_prompt(text):
+    """
+    Build the prompt of the request that produces the final summary
+    
+    Short documents are sent as they are. For long documents this runs the
+    map stage and any intermediate reduce rounds first.
+    
+    Args:
+        text (str): The text to summarize
+        
+    Returns:
+        str: The user message for the final request
+    """
+    text = compress_for_prompt(text)
+    chunks = split_into_chunks(text, SUMMARY_CHUNK_TOKENS)
+    
+    if len(chunks) <= 1:
+        return SUMMARY_PROMPT.format(text=text)
+    return map_reduce_prompt(chunks)
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_http_session():
+    """
+    Get the shared requests session for the Grok X API
+    
+    The session keeps up to GROK_POOL_SIZE connections alive, so requests
+    reuse an open TCP/TLS connection instead of opening a new one each time.
+    
+    Returns:
+        requests.Session: The shared session
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=GROK_POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update(_get_headers())
+            _session = session
+        return _session
+
+def _get_headers():
+    return {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {GROK_API_KEY}",
+    }
+
+def _build_payload(prompt, stream=False):
+    # Prepare the messages for chat completion API
+    messages = [
+        {
+            "role": "system",
+            "content": SYSTEM_PROMPT,
+        },
+        {
+            "role": "user",
+            "content": prompt,
+        },
+    ]
+    
+    return {
+        "messages": messages,
+        "model": GROK_MODEL,
+        "stream": stream,
+        "temperature": GROK_TEMPERATURE,
+    }
+
+def _parse_completion(result):
+    # Extract the summary from the chat completion response
+    return (
+        result.get("choices", [{}])[0].get("message", {}).get("content", "").strip()
+    )
+
+def request_completion(prompt):
+    """
+    Send one chat completion request to the Grok X API, through grok_scheduler
+    so it stays within the rate limits and transient failures are retried
+    
+    Args:
+        prompt (str): The user message
+        
+    Returns:
+        str: The completion text (empty if the response has none)
+    """
+    def request():
+        response = get_http_session().post(
+            GROK_API_URL, json=_build_payload(prompt), timeout=GROK_TIMEOUT
+        )
+        
+        # Properly handle response
+        response.raise_for_status()
+        return _parse_completion(response.json())
+    
+    return grok_scheduler.run(request, tokens=_request_tokens(prompt))
+
+def stream_completion(prompt):
+    """
+    Send one streaming chat completion request to the Grok X API, through grok_scheduler
+    
+    Args:
+        prompt (str): The user message
+        
+    Yields:
+        str: Content tokens from the server-sent event stream
+    """
+    def open_stream():
+        response = get_http_session().post(
+            GROK_API_URL, json=_build_payload(prompt, stream=True), timeout=GROK_TIMEOUT, stream=True
+        )
+        try:
+            response.raise_for_status()
+        except requests.exceptions.HTTPError:
+            response.close()
+            raise
+        return response
+    
+    # Hold the concurrency slot until the whole stream has been read;
+    # failures before the stream starts are retried by the scheduler
+    with grok_scheduler.slot():
+        response = grok_scheduler.run(open_stream, tokens=_request_tokens(prompt), use_slot=False)
+        with response:
+            for line in response.iter_lines():
+                line = line.decode('utf-8')
+                
+                # Skip keep-alive comments and other SSE fields
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                
+                event = json.loads(data)
+                token = event.get("choices", [{}])[0].get("delta", {}).get("content")
+                if token:
+                    yield token
+
+def _request_tokens(prompt):
+    # Tokens a request counts against the tokens-per-minute limit
+    return estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(prompt) + GROK_RESPONSE_TOKENS
+
+def map_reduce_prompt(chunks):
+    """
+    Summarise each chunk in parallel, then combine the partial summaries hierarchically
+    until they fit in one final request
+    
+    Args:
+        chunks (list): Document chunks in order
+        
+    Returns:
+        str: The user message for the final combine request
+    """
+    logger.info(f"Summarising {len(chunks)} chunks with up to {SUMMARY_CONCURRENCY} parallel requests")
+    
+    with ThreadPoolExecutor(max_workers=max(1, SUMMARY_CONCURRENCY)) as executor:
+        # Map: summarise every chunk
+        summaries = list(executor.map(request_completion, _chunk_prompts(chunks)))
+        
+        # Reduce: combine groups of partial summaries until one group is left
+        while len(summaries) > SUMMARY_REDUCE_FANIN:
+            summaries = list(executor.map(request_completion, _reduce_prompts(summaries)))
+    
+    return _reduce_prompts(summaries)[0]
+
+def _chunk_prompts(chunks):
+    # Keep the map stage within the token budget by trimming every chunk evenly
+    total_tokens = sum(estimate_tokens(chunk) for chunk in chunks)
+    if total_tokens > SUMMARY_TOKEN_BUDGET:
+        keep = SUMMARY_TOKEN_BUDGET / total_tokens
+        logger.info(f"Document has ~{total_tokens} tokens, trimming chunks to fit the {SUMMARY_TOKEN_BUDGET} token budget")
+        chunks = [chunk[:int(len(chunk) * keep)] for chunk in chunks]
+    
+    return [
+        CHUNK_PROMPT.format(part=index + 1, parts=len(chunks), text=chunk)
+        for index, chunk in enumerate(chunks)
+    ]
+
+def _reduce_prompts(summaries):
+    groups = [
+        summaries[index:index + SUMMARY_REDUCE_FANIN]
+        for index in range(0, len(summaries), SUMMARY_REDUCE_FANIN)
+    ]
+    return [REDUCE_PROMPT.format(text="\n\n".join(group)) for group in groups]
+
+class AsyncGrokClient:
+    """
+    asyncio client for the Grok X API
+    
+    One client holds a keep-alive connection pool of GROK_POOL_SIZE connections,
+    so a single worker can have many summaries in flight without a thread per
+    request. Use it as an async context manager:
+    
+        async with AsyncGrokClient() as client:
+            summaries = await asyncio.gather(*(client.summarize(text) for text in texts))
+    """
+    
+    def __init__(self, concurrency=None):
+        self.concurrency = concurrency or SUMMARY_CONCURRENCY
+        self._session = None
+    
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(
+            limit=GROK_POOL_SIZE, keepalive_timeout=GROK_KEEPALIVE_SECONDS
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            headers=_get_headers(),
+            timeout=aiohttp.ClientTimeout(total=GROK_TIMEOUT)
+        )
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._session.close()
+        self._session = None
+    
+    async def request_summary(self, prompt):
+        """
+        Send one chat completion request to the Grok X API
+        
+        Args:
+            prompt (str): The user message
+            
+        Returns:
+            str: The completion text (empty if the response has none)
+        """
+        async def request():
+            async with self._session.post(GROK_API_URL, json=_build_payload(prompt)) as response:
+                response.raise_for_status()
+                return _parse_completion(await response.json())
+        
+        return await grok_scheduler.run_async(request, tokens=_request_tokens(prompt))
+    
+    async def summarize(self, text):
+        """
+        Generate a summary the same way as generate_summary, without blocking the event loop
+        
+        Args:
+            text (str): The text to summarize
+            
+        Returns:
+            str: The generated summary
+        """
+        if not GROK_API_KEY:
+            logger.warning("Grok X API key not configured")
+            return generate_mock_summary(text)
+        
+        # The storage tier does blocking I/O, so run the lookups off the event loop
+        loop = asyncio.get_running_loop()
+        cache_key = get_summary_cache_key(text)
+        cached = await loop.run_in_executor(None, get_cached_summary, cache_key)
+        if cached:
+            return cached
+        
+        try:
+            compressed = compress_for_prompt(text)
+            chunks = split_into_chunks(compressed, SUMMARY_CHUNK_TOKENS)
+            
+            if len(chunks) <= 1:
+                summary = await self.request_summary(SUMMARY_PROMPT.format(text=compressed))
+            else:
+                summary = await self._map_reduce_summary(chunks)
+            
+            if not summary:
+                logger.warning("No summary content found in API response")
+                return generate_mock_summary(text)
+            
+            logger.info("Successfully generated summary")
+            await loop.run_in_executor(None, cache_summary, cache_key, summary)
+            return summary
+        
+        # API failures have already been retried
+        except aiohttp.ClientResponseError as e:
+            logger.error(f"HTTP Error: {e.status} {e.message}")
+            raise
+        
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Request Exception: {e!r}")
+            raise
+        
+        except Exception as e:
+            logger.error(f"Error generating summary: {e}")
+            return generate_mock_summary(text)
+    
+    async def _map_reduce_summary(self, chunks):
+        semaphore = asyncio.Semaphore(max(1, self.concurrency))
+        
+        async def bounded(prompt):
+            async with semaphore:
+                return await self.request_summary(prompt)
+        
+        summaries = await asyncio.gather(*(bounded(prompt) for prompt in _chunk_prompts(chunks)))
+        while len(summaries) > SUMMARY_REDUCE_FANIN:
+            summaries = await asyncio.gather(*(bounded(prompt) for prompt in _reduce_prompts(summaries)))
+        
+        return await self.request_summary(_reduce_prompts(summaries)[0])
+
+async def generate_summary_async(text: str):
+    """
+    Generate a summary using Grok X API from asyncio code
+    
+    Creates a client for this one call; to share a connection pool across many
+    summaries, use an AsyncGrokClient directly.
+    
+    Args:
+        text (str): The text to summarize
+        
+    Returns:
+        str: The generated summary
+    """
+    async with AsyncGrokClient() as client:
+        return await client.summarize(text)
+
+def estimate_tokens(text):
+    """
+    Estimate the number of tokens in a text (about 4 characters per token)
+    """
+    return len(text) // 4 + 1
+
+def split_into_chunks(text, max_tokens):
+    """
+    Split markdown into chunks of at most max_tokens tokens
+    
+    Chunks follow section boundaries (markdown headings) where possible, then
+    paragraph and page boundaries, and only split inside a paragraph when it is
+    longer than a whole chunk.
+    
+    Args:
+        text (str): Markdown text
+        max_tokens (int): Maximum tokens per chunk
+        
+    Returns:
+        list: Chunks in document order
+    """
+    max_chars = max_tokens * 4
+    
+    # Break the text into pieces that each fit in a chunk
+    pieces = []
+    starts = [match.start() for match in HEADING_PATTERN.finditer(text)]
+    bounds = [0] + [start for start in starts if start > 0] + [len(text)]
+    for section_start, section_end in zip(bounds, bounds[1:]):
+        section = text[section_start:section_end].strip()
+        if not section:
+            continue
+        if len(section) <= max_chars:
+            pieces.append(section)
+            continue
+        for paragraph in section.split("\n\n"):
+            paragraph = paragraph.strip()
+            for offset in range(0, len(paragraph), max_chars):
+                pieces.append(paragraph[offset:offset + max_chars])
+    
+    # Pack consecutive pieces into chunks
+    chunks = []
+    current = []
+    current_chars = 0
+    for piece in pieces:
+        if current and current_chars + len(piece) + 2 > max_chars:
+            chunks.append("\n\n".join(current))
+            current = []
+            current_chars = 0
+        current.append(piece)
+        current_chars += len(piece) + 2
+    if current:
+        chunks.append("\n\n".join(current))
+    
+    return chunks
+
+def compress_for_prompt(text):
+    """
+    Drop the least important sentences of a long text before it is sent to Grok
+    
+    Texts over SUMMARY_COMPRESS_MIN_TOKENS tokens are cut to SUMMARY_COMPRESS_RATIO
+    of their length, and never kept above SUMMARY_TOKEN_BUDGET.
+    
+    Args:
+        text (str): Markdown text
+        
+    Returns:
+        str: The text to build the prompt from
+    """
+    tokens = estimate_tokens(text)
+    if tokens <= SUMMARY_COMPRESS_MIN_TOKENS:
+        return text
+    
+    max_tokens = min(SUMMARY_TOKEN_BUDGET, max(SUMMARY_COMPRESS_MIN_TOKENS, int(tokens * SUMMARY_COMPRESS_RATIO)))
+    compressed = compress_text(text, max_tokens)
+    logger.info(f"Compressed document from ~{tokens} to ~{estimate_tokens(compressed)} tokens")
+    return compressed
+
+def compress_text(text, max_tokens):
+    """
+    Shorten markdown to about max_tokens tokens by keeping its most important sentences
+    
+    Sentences are ranked with TF-IDF weighted TextRank. Sentences repeated
+    across the document (running headers, footers, page numbers) and image
+    references are dropped first. The kept sentences stay in document order,
+    under the heading of their section.
+    
+    Args:
+        text (str): Markdown text
+        max_tokens (int): Token budget of the result
+        
+    Returns:
+        str: The compressed text (the original text if it already fits)
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    
+    units = _split_units(text)
+    
+    # Drop boilerplate: anything repeated BOILERPLATE_MIN_REPEATS times, and later copies of repeated sentences
+    keys = [" ".join(WORD_PATTERN.findall(unit['text'].lower())) for unit in units]
+    repeats = {}
+    for unit, key in zip(units, keys):
+        if not unit['heading']:
+            repeats[key] = repeats.get(key, 0) + 1
+    
+    candidates = []
+    seen = set()
+    for index, (unit, key) in enumerate(zip(units, keys)):
+        if unit['heading'] or not key or key in seen or repeats[key] >= BOILERPLATE_MIN_REPEATS:
+            continue
+        seen.add(key)
+        candidates.append(index)
+    
+    if not candidates:
+        return text[:max_tokens * 4]
+    
+    scores = score_sentences([units[index]['text'] for index in candidates])
+    
+    # Take the best sentences (plus the heading of their section) while they fit
+    chosen = set()
+    used = 0
+    for order in np.argsort(-scores, kind='stable'):
+        index = candidates[order]
+        section = units[index]['section']
+        cost = estimate_tokens(units[index]['text'])
+        if section is not None and section not in chosen:
+            cost += estimate_tokens(units[section]['text'])
+        if used + cost > max_tokens:
+            continue
+        chosen.add(index)
+        if section is not None:
+            chosen.add(section)
+        used += cost
+    
+    # Rebuild the paragraphs in document order
+    paragraphs = []
+    current = None
+    for index, unit in enumerate(units):
+        if index not in chosen:
+            continue
+        if current is None or unit['paragraph'] != current['paragraph']:
+            current = {'paragraph': unit['paragraph'], 'lines': [], 'heading': True}
+            paragraphs.append(current)
+        if unit['heading'] or current['heading']:
+            current['lines'].append(unit['text'])
+        else:
+            current['lines'][-1] += " " + unit['text']
+        current['heading'] = unit['heading']
+    
+    return "\n\n".join("\n".join(paragraph['lines']) for paragraph in paragraphs)
+
+def _split_units(text):
+    # Break markdown into headings and sentences, remembering each one's
+    # paragraph and the heading of its section
+    units = []
+    section = None
+    
+    for paragraph_index, paragraph in enumerate(re.split(r"\n\s*\n", text)):
+        lines = []
+        for line in paragraph.splitlines() + [None]:
+            if line is not None:
+                line = line.strip()
+                if IMAGE_PATTERN.match(line):
+                    continue
+                if line and not HEADING_PATTERN.match(line):
+                    lines.append(line)
+                    continue
+            
+            # A heading or the end of the paragraph ends the current run of text
+            for sentence in SENTENCE_PATTERN.split(" ".join(lines)):
+                if sentence.strip():
+                    units.append({'paragraph': paragraph_index, 'text': sentence.strip(), 'heading': False, 'section': section})
+            lines = []
+            
+            if line:
+                section = len(units)
+                units.append({'paragraph': paragraph_index, 'text': line, 'heading': True, 'section': None})
+    
+    return units
+
+def score_sentences(sentences):
+    """
+    Rank sentences by importance
+    
+    Sentences are sparse TF-IDF vectors; documents of up to TEXTRANK_MAX_SENTENCES
+    sentences are ranked with TextRank (PageRank over the cosine similarity
+    graph), longer ones by similarity to the TF-IDF centroid of the document.
+    
+    Args:
+        sentences (list): Sentence texts
+        
+    Returns:
+        numpy.ndarray: One score per sentence, higher is more important
+    """
+    vocabulary = {}
+    rows = []
+    columns = []
+    for index, sentence in enumerate(sentences):
+        for word in WORD_PATTERN.findall(sentence.lower()):
+            if word not in STOP_WORDS:
+                rows.append(index)
+                columns.append(vocabulary.setdefault(word, len(vocabulary)))
+    
+    count = len(sentences)
+    if not columns:
+        return np.zeros(count)
+    
+    # Sparse (sentence, term) TF-IDF weights, each sentence normalised to unit length
+    terms = len(vocabulary)
+    pairs, term_counts = np.unique(np.array(rows, dtype=np.int64) * terms + np.array(columns), return_counts=True)
+    rows = pairs // terms
+    columns = pairs % terms
+    
+    document_frequency = np.bincount(columns, minlength=terms)
+    idf = np.log((1 + count) / (1 + document_frequency)) + 1
+    weights = (1 + np.log(term_counts)) * idf[columns]
+    norms = np.sqrt(np.bincount(rows, weights * weights, minlength=count))
+    weights = weights / norms[rows]
+    
+    if count > TEXTRANK_MAX_SENTENCES:
+        centroid = np.bincount(columns, weights, minlength=terms) / count
+        return np.bincount(rows, weights * centroid[columns], minlength=count)
+    
+    # Cosine similarity accumulated term by term, so no sentence-by-vocabulary matrix is
+    # built; terms in a single sentence only touch the diagonal and are skipped
+    similarity = np.zeros((count, count), dtype=np.float32)
+    order = np.argsort(columns, kind='stable')
+    starts = np.flatnonzero(np.diff(columns[order], prepend=-1))
+    ends = np.append(starts[1:], len(order))
+    for start, end in zip(starts, ends):
+        if end - start > 1:
+            members = order[start:end]
+            similarity[np.ix_(rows[members], rows[members])] += np.outer(weights[members], weights[members])
+    np.fill_diagonal(similarity, 0)
+    return _pagerank(similarity)
+
+def _pagerank(similarity, damping=0.85, iterations=100, tolerance=1e-6):
+    # PageRank over a weighted similarity graph
+    count = len(similarity)
+    row_sums = similarity.sum(axis=1)
+    transition = np.divide(
+        similarity, row_sums[:, None], out=np.zeros_like(similarity), where=row_sums[:, None] > 0
+    )
+    dangling = row_sums == 0
+    
+    scores = np.full(count, 1.0 / count)
+    for _ in range(iterations):
+        updated = (1 - damping) / count + damping * (transition.T @ scores + scores[dangling].sum() / count)
+        if np.abs(updated - scores).sum() < tolerance:
+            return updated
+        scores = updated
+    return scores
+
+def get_summary_cache_key(text):
+    """
+    Build the cache key of a summary
+    
+    The key covers everything that changes the summary: the text (with
+    whitespace normalised), the prompts, the chunking settings, the model and
+    the temperature.
+    
+    Args:
+        text (str): The text to summarize
+        
+    Returns:
+        str: SHA-256 hex digest
+    """
+    normalized = " ".join(text.split())
+    params = json.dumps({
+        'system_prompt': SYSTEM_PROMPT,
+        'prompts': [SUMMARY_PROMPT, CHUNK_PROMPT, REDUCE_PROMPT],
+        'chunking': [SUMMARY_CHUNK_TOKENS, SUMMARY_REDUCE_FANIN, SUMMARY_TOKEN_BUDGET],
+        'compression': [SUMMARY_COMPRESS_RATIO, SUMMARY_COMPRESS_MIN_TOKENS],
+        'model': GROK_MODEL,
+        'temperature': GROK_TEMPERATURE,
+    }, sort_keys=True)
+    
+    digest = hashlib.sha256()
+    digest.update(params.encode('utf-8'))
+    digest.update(b"\0")
+    digest.update(normalized.encode('utf-8'))
+    return digest.hexdigest()
+
+def get_cached_summary(cache_key):
+    """
+    Look a summary up in the memory cache, then in the storage cache
+    
+    Args:
+        cache_key (str): Key from get_summary_cache_key
+        
+    Returns:
+        str: The cached summary, or None on a miss
+    """
+    if not SUMMARY_CACHE_ENABLED:
+        return None
+    
+    summary = summary_memory_cache.get(cache_key)
+    if summary:
+        _count('memory_hits')
+        logger.info(f"Summary cache hit (memory) for {cache_key}")
+        return summary
+    
+    try:
+        summary = summary_cache.get(cache_key)
+    except Exception as e:
+        logger.error(f"Error reading summary cache: {e}")
+        summary = None
+    
+    if summary:
+        _count('storage_hits')
+        logger.info(f"Summary cache hit (storage) for {cache_key}")
+        summary_memory_cache.put(cache_key, summary)
+        return summary
+    
+    _count('misses')
+    return None
 
-def _generate_mock_summary(text):
+def cache_summary(cache_key, summary):
+    """
+    Store a summary in both cache tiers
+    
+    Args:
+        cache_key (str): Key from get_summary_cache_key
+        summary (str): The generated summary
+    """
+    if not SUMMARY_CACHE_ENABLED:
+        return
+    
+    summary_memory_cache.put(cache_key, summary)
+    try:
+        summary_cache.put(cache_key, summary)
+    except Exception as e:
+        logger.error(f"Error writing summary cache: {e}")
+
+def get_summary_cache_stats():
+    """
+    Get the summary cache hit and miss counters of this process
+    
+    Returns:
+        dict: memory_hits, storage_hits, misses, hits and hit_rate
+    """
+    with _stats_lock:
+        stats = dict(summary_cache_stats)
+    
+    stats['hits'] = stats['memory_hits'] + stats['storage_hits']
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+    return stats
+
+def _count(counter):
+    with _stats_lock:
+        summary_cache_stats[counter] += 1
+
+def generate_mock_summary(text):
     """
     Generate a simple summary without using an external API
     This is a fallback method for when the API is unavailable
     """
     logger.info("Using fallback mock summary generation")
     
-    # Implementation remains the same
-    paragraphs = text.split("\n\n")
-    summary_parts = []
-    
-    for para in paragraphs[:5]:
-        sentences = para.split(". ")
-        if sentences:
-            summary_parts.append(sentences[0])
-    
-    summary = " ".join(summary_parts)
+    # Keep the highest-ranked sentences of the document
+    summary = compress_text(text, FALLBACK_SUMMARY_TOKENS)
     
     if os.environ.get('AWS_LAMBDA_FUNCTION_NAME'):
         env_note = "AWS Lambda"
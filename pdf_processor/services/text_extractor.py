@@ -0,0 +1,83 @@
+import os
+import threading
+import multiprocessing
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF
+
+from pdf_utils import get_page_count
+
+# Number of processes for fast text extraction. Lambda has no /dev/shm for
+# multiprocessing queues, so it defaults to 0, which extracts in the calling process.
+FAST_EXTRACT_WORKERS = int(os.environ.get(
+    'FAST_EXTRACT_WORKERS',
+    0 if 'AWS_LAMBDA_FUNCTION_NAME' in os.environ else min(4, os.cpu_count() or 1)
+))
+
+# Documents with fewer pages than this are extracted in the calling process
+FAST_EXTRACT_MIN_PAGES = int(os.environ.get('FAST_EXTRACT_MIN_PAGES', 32))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def extract_range(pdf_bytes, start_page, end_page):
+    """
+    Extract the text layer of a range of pages
+
+    Args:
+        pdf_bytes (bytes): PDF content
+        start_page (int): First page to extract
+        end_page (int): Page after the last page to extract
+
+    Returns:
+        list: Text of each page, in page order
+    """
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        return [doc[page_id].get_text() for page_id in range(start_page, end_page)]
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=FAST_EXTRACT_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _executor
+
+def extract_page_texts(pdf_bytes, start_page=0):
+    """
+    Extract the text layer of every page with PyMuPDF
+
+    Long documents are split into one page range per worker process, and
+    each process opens the document and extracts its own range.
+
+    Args:
+        pdf_bytes (bytes): PDF content
+        start_page (int): First page to extract
+
+    Returns:
+        list: Text of each page from start_page on, in page order
+    """
+    page_count = get_page_count(pdf_bytes)
+    pages = page_count - start_page
+    if pages <= 0:
+        return []
+
+    if FAST_EXTRACT_WORKERS <= 1 or pages < FAST_EXTRACT_MIN_PAGES:
+        return extract_range(pdf_bytes, start_page, page_count)
+
+    # One contiguous page range per worker
+    range_size = -(-pages // FAST_EXTRACT_WORKERS)
+    starts = list(range(start_page, page_count, range_size))
+    ends = [min(start + range_size, page_count) for start in starts]
+
+    # Worker processes get a copy; buffers such as memory-mapped files can't be pickled
+    if not isinstance(pdf_bytes, bytes):
+        pdf_bytes = bytes(pdf_bytes)
+
+    texts = []
+    for range_texts in _get_executor().map(extract_range, repeat(pdf_bytes), starts, ends):
+        texts.extend(range_texts)
+    return texts
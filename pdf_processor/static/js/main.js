@@ -16,10 +16,10 @@ document.addEventListener("DOMContentLoaded", function () {
           return;
         }
 
-        // Check file size (16MB max)
-        const maxSize = 16 * 1024 * 1024; // 16MB in bytes
+        // Check file size (limit set by the server, in bytes)
+        const maxSize = parseInt(this.dataset.maxSize, 10) || 512 * 1024 * 1024;
         if (file.size > maxSize) {
-          alert("File is too large. Maximum size is 16MB.");
+          alert(`File is too large. Maximum size is ${Math.round(maxSize / (1024 * 1024))}MB.`);
           this.value = ""; // Clear the input
           return;
         }
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The app, the Lambda handler and the services import the service modules by bare name
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'pdf_processor'))
+sys.path.insert(0, os.path.join(ROOT, 'pdf_processor', 'services'))
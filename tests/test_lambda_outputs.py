@@ -0,0 +1,94 @@
+import boto3
+import pytest
+
+pytest.importorskip("magic_pdf")
+moto = pytest.importorskip("moto")
+
+import storage_service
+from storage_service import read_file
+
+TEXT = "Quarterly results were in line with the forecast. " * 40
+SUMMARY = "Results matched the forecast. " * 30
+EVENT = {"Records": [{"s3": {"bucket": {"name": "uploads"}, "object": {"key": "uploads/job-1/report.pdf"}}}]}
+
+
+class CountingTable:
+    def __init__(self, table):
+        self.table = table
+        self.updates = 0
+
+    def update_item(self, **kwargs):
+        self.updates += 1
+        return self.table.update_item(**kwargs)
+
+    def get_item(self, **kwargs):
+        return self.table.get_item(**kwargs)
+
+
+@pytest.fixture
+def handler(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with moto.mock_aws():
+        import lambda_handler
+
+        s3 = boto3.client("s3", region_name="us-east-1")
+        for bucket in ("uploads", lambda_handler.TEXT_BUCKET, lambda_handler.SUMMARY_BUCKET):
+            s3.create_bucket(Bucket=bucket)
+        dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+        jobs_table = dynamodb.create_table(
+            TableName="jobs",
+            KeySchema=[{"AttributeName": "job_id", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "job_id", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        # The shared client was created at import, outside the mock
+        monkeypatch.setattr(storage_service, "s3", s3)
+        monkeypatch.setattr(storage_service, "s3_cache", None)
+        monkeypatch.setattr(lambda_handler, "s3", s3)
+        monkeypatch.setattr(lambda_handler, "jobs_table", CountingTable(jobs_table))
+        monkeypatch.setattr(lambda_handler, "generate_summary", lambda text: SUMMARY)
+        yield lambda_handler, s3
+
+
+def test_lambda_outputs_are_compressed_and_readable(handler, monkeypatch):
+    lambda_handler, s3 = handler
+    monkeypatch.setattr(lambda_handler, "extract_text_from_pdf", lambda pdf_path, on_page=None, output_prefix=None: TEXT)
+
+    assert lambda_handler.handle_s3_event(EVENT)["statusCode"] == 200
+
+    job = lambda_handler.jobs_table.get_item(Key={"job_id": "job-1"})["Item"]
+    assert job["status"] == "completed"
+    for path, content in ((job["text_path"], TEXT), (job["summary_path"], SUMMARY)):
+        bucket, key = path[5:].split("/", 1)
+        stored = s3.get_object(Bucket=bucket, Key=key)
+        assert stored["Metadata"]["compression"] in ("zstd", "gzip")
+        assert len(stored["Body"].read()) < len(content)
+        assert read_file(path).decode("utf-8") == content
+
+    summary = lambda_handler.get_job_summary("job-1")
+    assert summary["statusCode"] == 200
+    assert SUMMARY in summary["body"]
+
+
+def test_lambda_records_output_prefix_and_throttles_progress(handler, monkeypatch):
+    lambda_handler, s3 = handler
+    output_prefixes = []
+
+    def extract_text_from_pdf(pdf_path, on_page=None, output_prefix=None):
+        output_prefixes.append(output_prefix)
+        for page_idx in range(200):
+            on_page({"page_idx": page_idx, "pages_total": 200, "markdown": f"Page {page_idx + 1}"})
+        return TEXT
+
+    monkeypatch.setattr(lambda_handler, "extract_text_from_pdf", extract_text_from_pdf)
+
+    assert lambda_handler.handle_s3_event(EVENT)["statusCode"] == 200
+
+    job = lambda_handler.jobs_table.get_item(Key={"job_id": "job-1"})["Item"]
+    assert job["output_prefix"] == output_prefixes[0] == "s3://uploads/output/job-1"
+    assert job["document_id"] == "report"
+    assert job["pages_done"] == job["pages_total"] == 200
+    # Start, first page, last page, OCR completed and completed; not one write per page
+    assert lambda_handler.jobs_table.updates <= 6
@@ -0,0 +1,91 @@
+import pytest
+
+fitz = pytest.importorskip("fitz")
+pytest.importorskip("magic_pdf")
+
+import ocr_service
+
+
+def make_pdf(path, page_count):
+    doc = fitz.open()
+    for page_idx in range(page_count):
+        doc.new_page().insert_text((72, 72), f"page {page_idx}")
+    doc.save(path)
+    doc.close()
+
+
+class FakeEngine:
+    workers = 1
+
+
+@pytest.fixture
+def fake_mineru(monkeypatch):
+    """
+    Replace the MinerU pipeline with one that reports which pages it was run on
+    """
+    calls = []
+
+    def run_mineru(pdf_bytes, document_id, parse_method='auto', shard_pages=None):
+        with fitz.open(stream=bytes(pdf_bytes), filetype="pdf") as doc:
+            first = int(doc[0].get_text().split()[1])
+            page_ids = list(range(first, first + doc.page_count))
+        calls.append(page_ids)
+        if calls.fail_from is not None and first >= calls.fail_from:
+            raise RuntimeError("Task timed out")
+        return {"page_ids": page_ids}
+
+    def split_pages(result, start_page=0):
+        return [
+            {
+                "page_idx": page_idx,
+                "markdown": f"text of page {page_idx}",
+                "content_list": [],
+                "page_info": {"page_idx": page_idx},
+                "model_page": None,
+                "middle_header": {},
+            }
+            for page_idx in result["page_ids"]
+        ]
+
+    calls = type("Calls", (list,), {"fail_from": None})()
+    monkeypatch.setattr(ocr_service, "_run_mineru", run_mineru)
+    monkeypatch.setattr(ocr_service, "_split_pages", split_pages)
+    monkeypatch.setattr(ocr_service, "get_ocr_engine", lambda: FakeEngine())
+    monkeypatch.setattr(ocr_service, "OCR_STREAM_PAGES", 4)
+    monkeypatch.setattr(ocr_service, "OCR_CACHE_ENABLED", False)
+    monkeypatch.setattr(ocr_service, "OCR_CHECKPOINTS_ENABLED", True)
+    return calls
+
+
+def test_resume_skips_checkpointed_pages(tmp_path, fake_mineru):
+    pdf_path = str(tmp_path / "doc.pdf")
+    output_prefix = str(tmp_path / "output")
+    make_pdf(pdf_path, 8)
+
+    # The first attempt dies after its first window
+    fake_mineru.fail_from = 4
+    list(ocr_service.iter_pdf_pages(pdf_path, 'txt', output_prefix))
+    assert fake_mineru == [[0, 1, 2, 3], [4, 5, 6, 7]]
+
+    # The retry only runs the pages that were not finished
+    fake_mineru.fail_from = None
+    del fake_mineru[:]
+    pages = list(ocr_service.iter_pdf_pages(pdf_path, 'txt', output_prefix))
+
+    assert fake_mineru == [[4, 5, 6, 7]]
+    assert [page["page_idx"] for page in pages] == list(range(8))
+    assert [page["markdown"] for page in pages] == [f"text of page {i}" for i in range(8)]
+
+
+def test_windows_are_checkpointed_before_the_document_finishes(tmp_path, fake_mineru):
+    pdf_path = str(tmp_path / "doc.pdf")
+    output_prefix = str(tmp_path / "output")
+    make_pdf(pdf_path, 8)
+
+    # Stop reading after the first page, as a timed out job would
+    pages = ocr_service.iter_pdf_pages(pdf_path, 'txt', output_prefix)
+    next(pages)
+    pages.close()
+
+    checkpoints = sorted(path.name for path in (tmp_path / "output" / "pages").iterdir())
+    assert checkpoints[:4] == ["00000.json", "00001.json", "00002.json", "00003.json"]
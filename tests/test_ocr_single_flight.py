@@ -0,0 +1,81 @@
+import io
+import os
+import time
+import threading
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+pytest.importorskip("magic_pdf")
+
+import app as app_module
+from storage_service import write_file, join_path
+
+
+def make_pdf():
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), "The same document")
+    content = doc.tobytes()
+    doc.close()
+    return content
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    for name in ("UPLOAD_FOLDER", "TEXT_FOLDER", "SUMMARY_FOLDER", "OUTPUT_FOLDER"):
+        folder = tmp_path / name.lower()
+        folder.mkdir()
+        monkeypatch.setitem(app_module.app.config, name, str(folder))
+    monkeypatch.setattr(app_module, "process_summary_queue", lambda: None)
+    app_module.app.config["TESTING"] = True
+    return app_module.app.test_client()
+
+
+def upload(client, content):
+    response = client.post(
+        "/upload",
+        data={"file": (io.BytesIO(content), "report.pdf"), "parse_method": "txt"},
+        content_type="multipart/form-data",
+    )
+    assert response.status_code == 302
+    return response.headers["Location"].rstrip("/").rsplit("/", 1)[-1]
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_identical_uploads_share_ocr_and_diagnostics(client, monkeypatch):
+    runs = []
+    release = threading.Event()
+
+    def extract_text_from_pdf(pdf_path, parse_method='auto', on_page=None, output_prefix=None):
+        runs.append(pdf_path)
+        # Hold the run until the second upload has joined it
+        release.wait(10)
+        document_id = os.path.splitext(os.path.basename(pdf_path))[0]
+        write_file(join_path(output_prefix, "diagnostics", f"{document_id}_layout.pdf"), b"%PDF-1.7", "application/pdf")
+        return "The same document"
+
+    monkeypatch.setattr(app_module, "extract_text_from_pdf", extract_text_from_pdf)
+
+    content = make_pdf()
+    first = upload(client, content)
+    wait_for(lambda: runs)
+    second = upload(client, content)
+
+    flight_key = f"{app_module.hashlib.sha256(content).hexdigest()}-txt"
+    wait_for(lambda: len(app_module.ocr_flight.callers(flight_key)) == 2)
+    release.set()
+
+    for job_id in (first, second):
+        wait_for(lambda: app_module.get_job(job_id)["status"] == "ocr_completed")
+
+    assert len(runs) == 1
+    for job_id in (first, second):
+        response = client.get(f"/api/diagnostics/{job_id}/layout")
+        assert response.status_code == 200
+        assert response.data == b"%PDF-1.7"
@@ -0,0 +1,100 @@
+import io
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+from pdf_utils import PdfPreflight, get_page_count
+
+
+def make_pdf(page_count, **save_options):
+    doc = fitz.open()
+    for page_idx in range(page_count):
+        doc.new_page().insert_text((72, 72), f"page {page_idx}")
+    content = doc.tobytes(**save_options)
+    doc.close()
+    return content
+
+
+def preflight(content, chunk_size=1024):
+    check = PdfPreflight()
+    for start in range(0, len(content), chunk_size):
+        check.update(content[start:start + chunk_size])
+    return check
+
+
+def test_estimates_page_count():
+    content = make_pdf(3)
+    check = preflight(content, chunk_size=7)
+
+    assert check.is_pdf
+    assert check.estimated_page_count == 3
+    assert check.size == len(content)
+
+
+def test_incremental_update_counts_each_page_once(tmp_path):
+    path = str(tmp_path / "doc.pdf")
+    with open(path, "wb") as f:
+        f.write(make_pdf(3))
+
+    # Rewrite every page object in an incremental update
+    doc = fitz.open(path)
+    for page in doc:
+        page.set_rotation(90)
+    doc.saveIncr()
+    doc.close()
+
+    with open(path, "rb") as f:
+        content = f.read()
+    assert content.count(b"/Type/Page") + content.count(b"/Type /Page") - content.count(b"/Pages") > 3
+
+    assert preflight(content).estimated_page_count == 3
+    assert get_page_count(content) == 3
+
+
+def test_uncompressed_object_streams_are_counted():
+    content = make_pdf(3, use_objstms=1)
+
+    assert preflight(content).estimated_page_count == 3
+
+
+def test_compressed_object_streams_hide_pages_from_the_estimate():
+    content = make_pdf(3, use_objstms=1, deflate=1)
+
+    assert preflight(content).estimated_page_count is None
+    assert get_page_count(content) == 3
+
+
+def test_upload_limit_uses_the_real_page_count(tmp_path, monkeypatch):
+    pytest.importorskip("magic_pdf")
+    import app as app_module
+
+    for name in ("UPLOAD_FOLDER", "TEXT_FOLDER", "SUMMARY_FOLDER", "OUTPUT_FOLDER"):
+        folder = tmp_path / name.lower()
+        folder.mkdir()
+        monkeypatch.setitem(app_module.app.config, name, str(folder))
+    monkeypatch.setattr(app_module, "MAX_UPLOAD_PAGES", 3)
+    monkeypatch.setattr(app_module, "process_ocr_queue", lambda: None)
+    client = app_module.app.test_client()
+
+    # Three pages saved with an incremental update
+    path = str(tmp_path / "doc.pdf")
+    with open(path, "wb") as f:
+        f.write(make_pdf(3))
+    doc = fitz.open(path)
+    for page in doc:
+        page.set_rotation(90)
+    doc.saveIncr()
+    doc.close()
+
+    for content, accepted in ((open(path, "rb").read(), True), (make_pdf(4, use_objstms=1, deflate=1), False)):
+        response = client.post(
+            "/upload",
+            data={"file": (io.BytesIO(content), "doc.pdf")},
+            content_type="multipart/form-data",
+        )
+        assert response.status_code == 302
+        assert ("/status/" in response.headers["Location"]) == accepted
+        if accepted:
+            job_id = response.headers["Location"].rstrip("/").rsplit("/", 1)[-1]
+            assert app_module.get_job(job_id)["pages_total"] == 3
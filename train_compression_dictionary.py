@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Script to train a zstd dictionary on stored artifacts (extracted text, markdown,
+JSON outputs, cache entries and summaries) for the storage compression layer.
+Point ZSTD_DICT_PATH at the result to compress new artifacts with it, and list
+the previous dictionary in ZSTD_READ_DICT_PATHS so older artifacts stay readable.
+"""
+
+import os
+import sys
+import random
+import argparse
+
+# Make the service modules importable the same way the app imports them
+SERVICES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pdf_processor', 'services')
+sys.path.insert(0, SERVICES_DIR)
+
+# File types the dictionary is trained on
+SAMPLE_EXTENSIONS = ('.txt', '.md', '.json')
+
+def load_samples(folders, max_samples, max_bytes):
+    """
+    Read sample artifacts from folders or S3 prefixes
+
+    Args:
+        folders (list): Folders, S3 prefixes or s3:// URIs to sample from
+        max_samples (int): Maximum number of files to read
+        max_bytes (int): Files are cut to this size, since only their content patterns matter
+
+    Returns:
+        list: Contents of the sampled files (bytes)
+    """
+    from storage_service import list_files, read_file
+
+    paths = []
+    for folder in folders:
+        paths.extend(f['path'] for f in list_files(folder) if f['path'].lower().endswith(SAMPLE_EXTENSIONS))
+
+    random.shuffle(paths)
+    samples = []
+    for path in paths[:max_samples]:
+        try:
+            samples.append(read_file(path)[:max_bytes])
+        except Exception as e:
+            print(f"Skipping {path}: {e}")
+    return samples
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Train a zstd dictionary for stored artifacts')
+    parser.add_argument('folders', nargs='+', help='Folders or S3 prefixes containing artifacts')
+    parser.add_argument('--output', default='artifacts.zdict', help='File to write the dictionary to')
+    parser.add_argument('--dict-size', type=int, default=112640, help='Maximum dictionary size in bytes')
+    parser.add_argument('--max-samples', type=int, default=2000, help='Maximum number of files to train on')
+    parser.add_argument('--sample-bytes', type=int, default=128 * 1024, help='Bytes used from each file')
+    parser.add_argument('--seed', type=int, help='Random seed for reproducible sampling')
+
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    import zstandard
+    from compression import ZSTD_LEVEL, train_dictionary
+
+    samples = load_samples(args.folders, args.max_samples, args.sample_bytes)
+    if len(samples) < 10:
+        print(f"Error: found {len(samples)} samples, need at least 10")
+        return 1
+
+    dictionary = train_dictionary(samples, args.dict_size)
+    with open(args.output, 'wb') as f:
+        f.write(dictionary)
+
+    # Compare compression with and without the dictionary on the samples
+    plain = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+    with_dict = zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=zstandard.ZstdCompressionDict(dictionary))
+    original = sum(len(sample) for sample in samples)
+    plain_size = sum(len(plain.compress(sample)) for sample in samples)
+    dict_size = sum(len(with_dict.compress(sample)) for sample in samples)
+
+    print(f"Trained a {len(dictionary)} byte dictionary on {len(samples)} files ({original} bytes)")
+    print(f"Compression ratio: {original / plain_size:.1f}x without, {original / dict_size:.1f}x with the dictionary")
+    print(f"Use it with ZSTD_DICT_PATH={os.path.abspath(args.output)}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,10 +5,17 @@ This allows you to serve static files from S3/CloudFront instead of from Lambda.
 """
 
 import os
+import sys
 import mimetypes
-import boto3
+from concurrent.futures import ThreadPoolExecutor
 from botocore.exceptions import ClientError
 
+# Make the service modules importable the same way the app imports them
+SERVICES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pdf_processor', 'services')
+sys.path.insert(0, SERVICES_DIR)
+
+from aws_clients import get_s3_client, get_transfer_config, S3_MAX_CONCURRENCY
+
 # Settings
 STATIC_DIR = 'static'  # Directory containing static files
 S3_BUCKET = os.environ.get('STATIC_BUCKET')  # Get bucket name from environment
@@ -37,14 +44,14 @@ def upload_file(file_path, bucket, object_name=None):
     if content_type is None:
         content_type = 'application/octet-stream'
 
-    # Upload the file
-    s3_client = boto3.client('s3')
+    # Upload the file with the shared client
+    s3_client = get_s3_client()
     try:
         extra_args = {
             'ContentType': content_type,
             'CacheControl': 'max-age=86400'  # Cache for 1 day
         }
-        s3_client.upload_file(file_path, bucket, object_name, ExtraArgs=extra_args)
+        s3_client.upload_file(file_path, bucket, object_name, ExtraArgs=extra_args, Config=get_transfer_config())
         print(f"Uploaded {file_path} to s3://{bucket}/{object_name}")
     except ClientError as e:
         print(f"Error: {e}")
@@ -61,17 +68,19 @@ def upload_directory(directory, bucket):
     Returns:
         int: Number of files uploaded
     """
-    count = 0
+    uploads = []
     for root, dirs, files in os.walk(directory):
         for file in files:
             full_path = os.path.join(root, file)
             
             # Create relative path
             rel_path = os.path.relpath(full_path, os.path.dirname(directory))
-            
-            # Upload file
-            if upload_file(full_path, bucket, rel_path):
-                count += 1
+            uploads.append((full_path, rel_path))
+    
+    # Upload files concurrently over the shared connection pool
+    with ThreadPoolExecutor(max_workers=max(1, S3_MAX_CONCURRENCY)) as executor:
+        results = executor.map(lambda upload: upload_file(upload[0], bucket, upload[1]), uploads)
+        count = sum(1 for uploaded in results if uploaded)
     
     return count
 